@@ -0,0 +1,196 @@
+import numpy as np
+
+from interpreter import Interpreter
+
+
+class Lanes:
+    __slots__ = ("lanes", "locals", "stack", "pc")
+
+    def __init__(self, lanes, locals, stack, pc):
+        self.lanes = lanes
+        self.locals = locals
+        self.stack = stack
+        self.pc = pc
+
+    def select(self, mask):
+        return Lanes(self.lanes[mask],
+                     [value[mask] if value is not None else None for value in self.locals],
+                     [value[mask] for value in self.stack],
+                     self.pc)
+
+
+class BatchInterpreter:
+    # Runs one method over many int argument vectors in lockstep. Every lane of a group shares a pc, and
+    # locals and operand stack slots are int64 vectors. A branch that goes both ways splits the group by
+    # mask; split groups are merged again when they reach the same pc. Lanes that would overflow int64,
+    # divide by zero, or reach an instruction with no vector form (invoke, get, heap access) continue
+    # in the scalar Interpreter from their current state, as do groups smaller than min_lanes.
+    operations = {"add": np.add, "sub": np.subtract, "mul": np.multiply, "div": np.floor_divide, "mod": np.remainder}
+    comparisons = {"gt": np.greater, "ge": np.greater_equal, "le": np.less_equal}
+
+    def __init__(self, program, avail_programs, min_lanes=16):
+        self.program = program
+        self.avail_programs = avail_programs
+        self.bytecode = program['bytecode']
+        self.max_locals = program.get("max_locals", 0)
+        self.min_lanes = min_lanes
+        self.pending = {}
+        self.results = []
+        self.errors = {}
+
+    def run(self, inputs):
+        if not isinstance(inputs, np.ndarray):
+            inputs = [list(args) for args in inputs]
+        self.results = [None] * len(inputs)
+        self.errors = {}
+        self.pending = {}
+        try:
+            matrix = np.asarray(inputs, dtype=np.int64)
+            matrix = matrix.reshape(len(inputs), matrix.size // max(len(inputs), 1))
+        except (OverflowError, ValueError, TypeError):
+            for lane, args in enumerate(inputs):
+                self.run_scalar(lane, list(args), [], 0)
+            return self.results
+        arg_num = matrix.shape[1]
+        locals = [matrix[:, k] for k in range(arg_num)]
+        locals.extend([None] * (self.max_locals - arg_num))
+        self.enqueue(Lanes(np.arange(len(inputs)), locals, [], 0))
+        while self.pending:
+            pc = min(self.pending)
+            for group in self.merge(self.pending.pop(pc)):
+                self.execute(group)
+        return self.results
+
+    def enqueue(self, group):
+        self.pending.setdefault(group.pc, []).append(group)
+
+    def merge(self, groups):
+        shapes = {}
+        for group in groups:
+            shapes.setdefault(tuple(value is None for value in group.locals), []).append(group)
+        merged = []
+        for similar in shapes.values():
+            if len(similar) == 1:
+                merged.append(similar[0])
+                continue
+            locals = [None if similar[0].locals[k] is None else np.concatenate([group.locals[k] for group in similar])
+                      for k in range(len(similar[0].locals))]
+            stack = [np.concatenate([group.stack[k] for group in similar]) for k in range(len(similar[0].stack))]
+            merged.append(Lanes(np.concatenate([group.lanes for group in similar]), locals, stack, similar[0].pc))
+        return merged
+
+    def unsafe(self, operant, a, b):
+        # Lanes where int64 arithmetic would not match Python ints, or where the scalar path has to raise
+        if operant == "add":
+            result = a + b
+            return ((a ^ result) & (b ^ result)) < 0
+        if operant == "sub":
+            result = a - b
+            return ((a ^ b) & (a ^ result)) < 0
+        if operant == "mul":
+            return np.abs(a.astype(np.float64) * b) >= 2.0**62
+        return (b == 0) | ((a == np.iinfo(np.int64).min) & (b == -1))
+
+    def execute(self, group):
+        bytecode = self.bytecode
+        with np.errstate(over="ignore"):
+            while True:
+                if len(group.lanes) < self.min_lanes:
+                    return self.fallback(group)
+                b = bytecode[group.pc]
+                opr = b["opr"]
+                stack = group.stack
+                if opr == "push":
+                    value = (b["value"] or {}).get("value")
+                    if type(value) is not int or not -2**63 <= value < 2**63:
+                        return self.fallback(group)
+                    stack.append(np.full(len(group.lanes), value, dtype=np.int64))
+                elif opr == "load":
+                    value = group.locals[b["index"]] if b["index"] < len(group.locals) else None
+                    if value is None:
+                        return self.fallback(group)
+                    stack.append(value)
+                elif opr == "store":
+                    if b["index"] >= len(group.locals):
+                        return self.fallback(group)
+                    group.locals[b["index"]] = stack.pop()
+                elif opr == "incr":
+                    value = group.locals[b["index"]]
+                    if value is None:
+                        return self.fallback(group)
+                    amount = np.full(len(group.lanes), b["amount"], dtype=np.int64)
+                    unsafe = self.unsafe("add", value, amount)
+                    if unsafe.any():
+                        self.fallback(group.select(unsafe))
+                        group = group.select(~unsafe)
+                        continue
+                    group.locals[b["index"]] = value + amount
+                elif opr == "binary":
+                    operation = BatchInterpreter.operations.get(b["operant"])
+                    if operation is None:
+                        return self.fallback(group)
+                    unsafe = self.unsafe(b["operant"], stack[-2], stack[-1])
+                    if unsafe.any():
+                        self.fallback(group.select(unsafe))
+                        group = group.select(~unsafe)
+                        continue
+                    value = operation(stack[-2], stack[-1])
+                    del stack[-2:]
+                    stack.append(value)
+                elif opr in ("if", "ifz"):
+                    comparison = BatchInterpreter.comparisons.get(b["condition"])
+                    if comparison is None:
+                        return self.fallback(group)
+                    if opr == "if":
+                        taken = comparison(stack[-2], stack[-1])
+                        del stack[-2:]
+                    else:
+                        taken = comparison(stack.pop(), 0)
+                    if taken.all():
+                        group.pc = b["target"]
+                    elif not taken.any():
+                        group.pc += 1
+                    else:
+                        jumped = group.select(taken)
+                        jumped.pc = b["target"]
+                        group = group.select(~taken)
+                        group.pc += 1
+                        self.enqueue(jumped)
+                        return self.enqueue(group)
+                    if group.pc in self.pending:
+                        return self.enqueue(group)
+                    continue
+                elif opr == "goto":
+                    group.pc = b["target"]
+                    if group.pc in self.pending:
+                        return self.enqueue(group)
+                    continue
+                elif opr == "dup":
+                    stack.extend(stack[-b["words"]:])
+                elif opr == "return":
+                    values = stack[-1].tolist() if b["type"] != None else [None] * len(group.lanes)
+                    for lane, value in zip(group.lanes.tolist(), values):
+                        self.results[lane] = value
+                    return
+                else:
+                    return self.fallback(group)
+                group.pc += 1
+
+    def fallback(self, group):
+        locals = [value.tolist() if value is not None else None for value in group.locals]
+        stack = [value.tolist() for value in group.stack]
+        for k, lane in enumerate(group.lanes.tolist()):
+            lv = [value[k] if value is not None else None for value in locals]
+            self.run_scalar(lane, lv, [value[k] for value in stack], group.pc)
+
+    def run_scalar(self, lane, lv, os, pc):
+        interpret = Interpreter(self.program, False, self.avail_programs)
+        try:
+            self.results[lane] = interpret.run((lv, os, pc))
+        except Exception as error:
+            self.errors[lane] = error
+
+
+def run_batch(program, inputs, avail_programs, min_lanes=16):
+    batch = BatchInterpreter(program, avail_programs, min_lanes)
+    return batch.run(inputs)
@@ -0,0 +1,204 @@
+import sys
+import json
+import glob
+import time
+import argparse
+import tracemalloc
+
+from interpreter import Interpreter, Profiler, get_functions
+
+
+def push(value):
+    return {"opr": "push", "value": {"type": "integer", "value": value}}
+
+def load(index, type="int"):
+    return {"opr": "load", "type": type, "index": index}
+
+def store(index, type="int"):
+    return {"opr": "store", "type": type, "index": index}
+
+def binary(operant):
+    return {"opr": "binary", "type": "int", "operant": operant}
+
+def branch(condition, target):
+    return {"opr": "if", "condition": condition, "target": target}
+
+def incr(index, amount):
+    return {"opr": "incr", "index": index, "amount": amount}
+
+def goto(target):
+    return {"opr": "goto", "target": target}
+
+def invoke(name, arg_num):
+    return {"opr": "invoke", "access": "static",
+            "method": {"is_interface": False, "ref": {"kind": "class", "name": "Benchmark"},
+                       "name": name, "args": [{"base": "int"}] * arg_num, "returns": {"base": "int"}}}
+
+def ret(type="int"):
+    return {"opr": "return", "type": type}
+
+def method(bytecode, max_locals):
+    return {"max_stack": 8, "max_locals": max_locals, "exceptions": [], "stack_map": None, "bytecode": bytecode}
+
+
+def arithmetic_loop():
+    # acc = 0; for (i = n; i > 0; i--) acc = (acc * 31 + i) % 1000003; return acc
+    return method([
+        push(0), store(1),
+        load(0), store(2),
+        load(2), push(0), branch("le", 17),
+        load(1), push(31), binary("mul"), load(2), binary("add"), push(1000003), binary("mod"), store(1),
+        incr(2, -1), goto(4),
+        load(1), ret(),
+    ], 3)
+
+
+def recursion():
+    # depth(n) = n <= 0 ? 0 : depth(n - 1) + 1
+    return method([
+        load(0), push(0), branch("gt", 5),
+        push(0), ret(),
+        load(0), push(1), binary("sub"), invoke("depth", 1), push(1), binary("add"), ret(),
+    ], 1)
+
+
+def array_fill_sum():
+    # a = new int[n]; for (i = 0; i < n; i++) a[i] = i; s = 0; for (i = 0; i < n; i++) s += a[i]; return s
+    return method([
+        load(0), {"opr": "newarray", "dim": 1, "type": "int"}, store(1, "ref"),
+        push(0), store(2),
+        load(2), load(0), branch("ge", 14),
+        load(1, "ref"), load(2), load(2), {"opr": "array_store", "type": "int"},
+        incr(2, 1), goto(5),
+        push(0), store(3), push(0), store(2),
+        load(2), load(1, "ref"), {"opr": "arraylength"}, branch("ge", 30),
+        load(3), load(1, "ref"), load(2), {"opr": "array_load", "type": "int"}, binary("add"), store(3),
+        incr(2, 1), goto(18),
+        load(3), ret(),
+    ], 4)
+
+
+def branchy():
+    # for (i = n; i > 0; i--) { r = i % 4; if (r <= 0) a += 3; else if (r >= 3) a -= 1; else a += r; } return a
+    return method([
+        push(0), store(1),
+        load(0), store(2),
+        load(2), push(0), branch("le", 33),
+        load(2), push(4), binary("mod"), store(3),
+        load(3), push(0), branch("gt", 19),
+        load(1), push(3), binary("add"), store(1), goto(31),
+        load(3), push(3), branch("ge", 27),
+        load(1), load(3), binary("add"), store(1), goto(31),
+        load(1), push(1), binary("sub"), store(1),
+        incr(2, -1), goto(4),
+        load(1), ret(),
+    ], 4)
+
+
+def synthetic_benchmarks():
+    programs = {
+        "arithmetic_loop": arithmetic_loop(),
+        "depth": recursion(),
+        "array_fill_sum": array_fill_sum(),
+        "branchy": branchy(),
+    }
+    return programs, [
+        ("synthetic/arithmetic_loop", "arithmetic_loop", [20000], []),
+        ("synthetic/recursion", "depth", [5000], []),
+        ("synthetic/array_fill_sum", "array_fill_sum", [10000], []),
+        ("synthetic/branchy", "branchy", [20000], []),
+    ]
+
+
+def corpus_benchmarks(folder_path):
+    byte_codes = {}
+    for path in glob.glob(folder_path + '/**/*.json', recursive=True):
+        with open(path, 'r') as file:
+            byte_codes.update(get_functions(json.load(file)))
+    cases = [
+        ("case/factorial", "factorial", [500], []),
+        ("case/access", "access", [3, 0], [list(range(10))]),
+        ("case/newArray", "newArray", [], []),
+    ]
+    return byte_codes, [case for case in cases if case[1] in byte_codes]
+
+
+def measure(method_name, locals, memory, byte_codes, min_seconds):
+    def run(**kwargs):
+        interpret = Interpreter(byte_codes[method_name], False, byte_codes, **kwargs)
+        interpret.memory = [list(values) for values in memory]
+        return interpret.run((list(locals), [], 0))
+
+    profile = Profiler()
+    run(profile=profile)
+    instructions = sum(count for count, _ in profile.opcodes.values())
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best, total, runs = float("inf"), 0.0, 0
+    while total < min_seconds or runs < 3:
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        runs += 1
+    return {"instructions": instructions, "seconds": best, "instructions_per_second": instructions / best,
+            "peak_bytes": peak, "runs": runs}
+
+
+def run_benchmarks(corpus_path=None, min_seconds=0.5):
+    results = {}
+    suites = [synthetic_benchmarks()]
+    if corpus_path:
+        suites.append(corpus_benchmarks(corpus_path))
+    for byte_codes, cases in suites:
+        for (name, method_name, locals, memory) in cases:
+            results[name] = measure(method_name, locals, memory, byte_codes, min_seconds)
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            before = baseline[name]["instructions_per_second"]
+            change = result["instructions_per_second"] / before - 1
+            if change < -threshold:
+                regressions.append((name, before, result["instructions_per_second"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interpreter benchmarks")
+    parser.add_argument("--corpus", default="../course-02242-examples/decompiled/dtu/compute/exec/")
+    parser.add_argument("--save", help="write results to this baseline file")
+    parser.add_argument("--check", help="compare against this baseline file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed throughput drop, 0.1 = 10%%")
+    parser.add_argument("--min-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.corpus, args.min_seconds)
+    for name, result in results.items():
+        print(f"{name:28s} {result['instructions']:>9d} instr  {result['seconds'] * 1000:9.2f} ms  "
+              f"{result['instructions_per_second'] / 1e6:6.2f} Minstr/s  peak {result['peak_bytes'] / 1024:9.1f} KiB")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.check:
+        with open(args.check, "r") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, change in regressions:
+            print(f"REGRESSION {name}: {before / 1e6:.2f} -> {after / 1e6:.2f} Minstr/s ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import glob
+import mmap
+import struct
+from collections.abc import Mapping
+
+
+IMAGE_MAGIC = b"JVMIMAGE"
+IMAGE_VERSION = 1
+
+# magic, version, method count, constant count, constants offset, index offset
+HEADER = struct.Struct("<8sIIIQQ")
+# name constant, flags, header constant, code constant, instruction count, body offset
+INDEX = struct.Struct("<IIIIIQ")
+# opcode, offset (-1 when absent), operands constant
+INSTRUCTION = struct.Struct("<HiI")
+OFFSET = struct.Struct("<Q")
+
+CASE = 1
+
+
+class ImageWriter:
+    def __init__(self):
+        self.constants = []
+        self.constant_ids = {}
+        self.opcodes = []
+        self.opcode_ids = {}
+        self.methods = {}
+
+    def constant(self, value):
+        # Constants are stored as canonical JSON, so equal operands share one entry
+        encoded = json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+        index = self.constant_ids.get(encoded)
+        if index is None:
+            index = self.constant_ids[encoded] = len(self.constants)
+            self.constants.append(encoded)
+        return index
+
+    def opcode(self, opr):
+        index = self.opcode_ids.get(opr)
+        if index is None:
+            index = self.opcode_ids[opr] = len(self.opcodes)
+            self.opcodes.append(opr)
+        return index
+
+    def add_class(self, json_obj):
+        # Same precedence as byte_codes.update(get_functions(...)): a later @Case method replaces an earlier
+        # one, and methods without the annotation never replace an @Case method
+        for func in json_obj['methods']:
+            is_case = any(anno['type'] == 'dtu/compute/exec/Case' for anno in func['annotations'])
+            if is_case or not self.methods.get(func['name'], (False,))[0]:
+                self.methods[func['name']] = (is_case, func)
+
+    def encode_method(self, func):
+        header = {key: value for key, value in func.items() if key != 'code'}
+        code = func['code']
+        if code is None:
+            return header, None, b""
+        extra = {key: value for key, value in code.items() if key != 'bytecode'}
+        body = []
+        for b in code['bytecode']:
+            operands = {key: value for key, value in b.items() if key not in ("opr", "offset")}
+            body.append(INSTRUCTION.pack(self.opcode(b["opr"]), b.get("offset", -1), self.constant(operands)))
+        return header, extra, b"".join(body)
+
+    def write(self, image_path):
+        self.constant(None)
+        records, bodies = [], []
+        for name in sorted(self.methods, key=lambda name: name.encode()):
+            (is_case, func) = self.methods[name]
+            header, extra, body = self.encode_method(func)
+            count = len(body) // INSTRUCTION.size if extra is not None else 0
+            records.append((self.constant(name), CASE if is_case else 0, self.constant(header), self.constant(extra), count))
+            bodies.append(body)
+        opcodes = self.constant(self.opcodes)
+
+        index_offset = HEADER.size
+        body_offset = index_offset + INDEX.size * len(records)
+        index = []
+        for record, body in zip(records, bodies):
+            index.append(INDEX.pack(*record, body_offset))
+            body_offset += len(body)
+        constants_offset = body_offset
+        blob_offset = constants_offset + OFFSET.size * (len(self.constants) + 1)
+        offsets, position = [], blob_offset
+        for encoded in self.constants:
+            offsets.append(OFFSET.pack(position))
+            position += len(encoded)
+        offsets.append(OFFSET.pack(position))
+
+        temporary = f"{image_path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, len(records), len(self.constants), constants_offset, index_offset))
+            file.write(b"".join(index))
+            file.write(b"".join(bodies))
+            file.write(b"".join(offsets))
+            file.write(b"".join(self.constants))
+            # The opcode table is the last constant, so readers find it without another header field
+            assert opcodes == len(self.constants) - 1
+        os.replace(temporary, image_path)
+
+
+def compile_image(folder_path, image_path):
+    writer = ImageWriter()
+    for path in sorted(glob.glob(folder_path + '/**/*.json', recursive=True)):
+        with open(path, 'r') as file:
+            writer.add_class(json.load(file))
+    writer.write(image_path)
+    return len(writer.methods)
+
+
+class ProgramImage(Mapping):
+    # The @Case methods of an image as {name: code}, like get_functions over the corpus. The file is memory
+    # mapped; names are found by binary search in the sorted index and a method's bytecode is only decoded
+    # the first time it is looked up. Pickles as its path, so pool workers map the same file
+    def __init__(self, image_path, cases_only=True):
+        self.image_path = image_path
+        self.cases_only = cases_only
+        with open(image_path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.method_count, self.constant_count, self.constants_offset,
+         self.index_offset) = HEADER.unpack_from(self.data, 0)
+        if magic != IMAGE_MAGIC or version != IMAGE_VERSION:
+            raise ValueError(f"{image_path} is not a version {IMAGE_VERSION} program image")
+        self.constants = {}
+        self.loaded = {}
+        self.opcodes = self.constant(self.constant_count - 1)
+        self.length = None
+
+    def __reduce__(self):
+        return (ProgramImage, (self.image_path, self.cases_only))
+
+    def raw_constant(self, index):
+        (start,) = OFFSET.unpack_from(self.data, self.constants_offset + OFFSET.size * index)
+        (end,) = OFFSET.unpack_from(self.data, self.constants_offset + OFFSET.size * (index + 1))
+        return self.data[start:end]
+
+    def constant(self, index):
+        if index not in self.constants:
+            self.constants[index] = json.loads(self.raw_constant(index))
+        return self.constants[index]
+
+    def record(self, k):
+        return INDEX.unpack_from(self.data, self.index_offset + INDEX.size * k)
+
+    def find(self, name):
+        target = name.encode()
+        (low, high) = (0, self.method_count)
+        while low < high:
+            middle = (low + high) // 2
+            record = self.record(middle)
+            key = self.constant(record[0]).encode()
+            if key < target:
+                low = middle + 1
+            elif key > target:
+                high = middle
+            else:
+                return record
+        return None
+
+    def header(self, name):
+        record = self.find(name)
+        if record is None or (self.cases_only and not record[1] & CASE):
+            raise KeyError(name)
+        return self.constant(record[2])
+
+    def __getitem__(self, name):
+        if name in self.loaded:
+            return self.loaded[name]
+        record = self.find(name) if isinstance(name, str) else None
+        if record is None or (self.cases_only and not record[1] & CASE):
+            raise KeyError(name)
+        (_, _, _, code_constant, count, body_offset) = record
+        code = self.constant(code_constant)
+        if code is not None:
+            code = dict(code)
+            bytecode = []
+            for k in range(count):
+                (opcode, offset, operands) = INSTRUCTION.unpack_from(self.data, body_offset + INSTRUCTION.size * k)
+                b = {"offset": offset, "opr": self.opcodes[opcode]} if offset >= 0 else {"opr": self.opcodes[opcode]}
+                b.update(self.constant(operands))
+                bytecode.append(b)
+            code["bytecode"] = bytecode
+        self.loaded[name] = code
+        return code
+
+    def __iter__(self):
+        for k in range(self.method_count):
+            record = self.record(k)
+            if not self.cases_only or record[1] & CASE:
+                yield self.constant(record[0])
+
+    def __len__(self):
+        if self.length is None:
+            self.length = sum(1 for _ in self)
+        return self.length
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("usage: python image.py <decompiled folder> <image file>")
+        sys.exit(2)
+    count = compile_image(sys.argv[1], sys.argv[2])
+    print(f"wrote {count} methods to {sys.argv[2]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
+import sys
+import time
 import json
 import glob
+import re
 import subprocess
+import os
+import threading
 import pathlib
+import hashlib
+from array import array
+from collections import deque, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Comparison:
@@ -59,182 +69,1034 @@ class JavaMethod:
         return field_dict.get("type", {}).get("name") if field_dict == valid_dict else None
 
     @staticmethod
-    def _println(string):
+    def _println(string=""):
         print(string)
 
 
+class RingBufferSink:
+    def __init__(self, capacity=1000):
+        self.records = deque(maxlen=capacity)
+
+    def write(self, line):
+        self.records.append(line)
+
+
+class FileSink:
+    def __init__(self, file):
+        self.file = open(file, "w") if isinstance(file, (str, pathlib.Path)) else file
+
+    def write(self, line):
+        self.file.write(line + "\n")
+
+    def close(self):
+        if self.file not in (sys.stdout, sys.stderr):
+            self.file.close()
+
+
+class Trace:
+    OFF = "off"
+    SUMMARY = "summary"
+    INSTRUCTION = "instruction"
+    SAMPLED = "sampled"
+
+    def __init__(self, level=OFF, sink=None, every=1):
+        self.level = level
+        self.sink = sink if sink is not None else RingBufferSink()
+        if level == Trace.INSTRUCTION:
+            self.every = 1
+        elif level == Trace.SAMPLED:
+            self.every = every
+        else:
+            self.every = 0
+        self.steps = 0
+
+    def start(self, f):
+        self.sink.write("--- Starting execution... --- " + repr(f))
+
+    def instruction(self, f, pc):
+        self.sink.write(f"{self.steps}: {f.method.name}@{pc} {f.method.program['bytecode'][pc]} -> {f!r}")
+
+    def done(self, return_value):
+        self.sink.write(f"--- Done after {self.steps} steps --- returned {return_value!r}")
+
+    def failed(self, pc, error):
+        self.sink.write(f"--- Failed after {self.steps} steps at pc={pc} --- {error!r}")
+
+
+class Profiler:
+    def __init__(self):
+        self.opcodes = {}
+        self.pcs = {}
+        self.calls = {}
+        self.stacks = {}
+        self.nodes = {}
+        self.paths = []
+
+    def node(self, parent, name):
+        # Call paths are interned as (parent node, method name) so a deep stack costs O(1) per push
+        key = (parent, name)
+        node = self.nodes.get(key)
+        if node is None:
+            node = len(self.paths)
+            self.nodes[key] = node
+            self.paths.append(name if parent < 0 else self.paths[parent] + ";" + name)
+        return node
+
+    def to_json(self):
+        return {
+            "opcodes": {handler.__name__.lstrip("_"): {"count": count, "ns": ns}
+                        for handler, (count, ns) in sorted(self.opcodes.items(), key=lambda item: -item[1][1])},
+            "pcs": {name: {str(pc): count for pc, count in enumerate(counts) if count}
+                    for name, counts in self.pcs.items()},
+            "calls": [{"caller": caller, "callee": callee, "count": count}
+                      for (caller, callee), count in sorted(self.calls.items())],
+        }
+
+    def collapsed(self):
+        return "".join(f"{self.paths[node]} {ns}\n" for node, ns in sorted(self.stacks.items()))
+
+    def write_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_json(), file, indent=2)
+
+    def write_collapsed(self, path):
+        with open(path, "w") as file:
+            file.write(self.collapsed())
+
+
+class ArrayIndexOutOfBoundsException(IndexError):
+    pass
+
+
+class NegativeArraySizeException(ValueError):
+    pass
+
+
+class NullPointerException(TypeError):
+    pass
+
+
+class Outcome:
+    RETURNED = "returned"
+    FUEL_EXHAUSTED = "fuel exhausted"
+    TIMEOUT = "timeout"
+    OUT_OF_MEMORY = "out of memory"
+    CANCELLED = "cancelled"
+
+    def __init__(self, status, value=None, message=None):
+        self.status = status
+        self.value = value
+        self.message = message
+
+    def __repr__(self):
+        return f"Outcome({self.status!r}, {self.value!r}, {self.message!r})"
+
+
+class Limits:
+    # Steps are charged at backward branches (by loop length) and calls; the clock and the cancel hook
+    # are only consulted every check_every such charges, and the heap size only on allocation
+    def __init__(self, steps=None, seconds=None, heap_bytes=None, cancel=None, check_every=256):
+        self.steps = steps
+        self.seconds = seconds
+        self.heap_bytes = heap_bytes
+        self.cancel = cancel
+        self.check_every = check_every
+
+
+class LimitExceeded(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.outcome = Outcome(status, None, message)
+
+
+class Heap:
+    # Primitive arrays allocated by the program are typed array.array buffers, reference arrays lists of refs.
+    # Lists handed in by the caller are kept as they are, so array_store writes show up in the caller's list
+    typecodes = {"int": "i", "long": "q", "short": "h", "char": "H", "byte": "b", "boolean": "b",
+                 "float": "f", "double": "d"}
+
+    def __init__(self, arrays=()):
+        self.arrays = [Heap.from_list(values) for values in arrays]
+        self.size = sum(Heap.size_of(values) for values in self.arrays)
+        self.limit = None
+
+    @staticmethod
+    def size_of(values):
+        return len(values) * (values.itemsize if isinstance(values, array) else 8)
+
+    @staticmethod
+    def from_list(values):
+        if isinstance(values, (array, list)):
+            return values
+        return list(values)
+
+    def __getitem__(self, ref):
+        return self.arrays[ref]
+
+    def __len__(self):
+        return len(self.arrays)
+
+    def __repr__(self):
+        return repr([list(values) for values in self.arrays])
+
+    def allocate(self, type, sizes):
+        size = sizes[0]
+        if size < 0:
+            raise NegativeArraySizeException(size)
+        if len(sizes) > 1:
+            values = [self.allocate(type, sizes[1:]) for _ in range(size)]
+        elif isinstance(type, str) and type in Heap.typecodes:
+            typecode = Heap.typecodes[type]
+            values = array(typecode, [0]) * size
+        else:
+            values = [None] * size
+        self.size += Heap.size_of(values)
+        if self.limit is not None and self.size > self.limit:
+            raise LimitExceeded(Outcome.OUT_OF_MEMORY, f"heap of {self.size} bytes exceeds {self.limit}")
+        self.arrays.append(values)
+        return len(self.arrays) - 1
+
+    def load(self, ref, index):
+        if ref is None:
+            raise NullPointerException("array_load on null")
+        values = self.arrays[ref]
+        if index < 0 or index >= len(values):
+            raise ArrayIndexOutOfBoundsException(f"Index {index} out of bounds for length {len(values)}")
+        return values[index]
+
+    def store(self, ref, index, value):
+        if ref is None:
+            raise NullPointerException("array_store on null")
+        values = self.arrays[ref]
+        if index < 0 or index >= len(values):
+            raise ArrayIndexOutOfBoundsException(f"Index {index} out of bounds for length {len(values)}")
+        try:
+            values[index] = value
+        except (OverflowError, TypeError):
+            # Arithmetic is unbounded, so a value can outgrow its typed buffer; the array becomes a plain list
+            values = self.widen(ref)
+            values[index] = value
+
+    def widen(self, ref):
+        values = list(self.arrays[ref])
+        self.size += Heap.size_of(values) - Heap.size_of(self.arrays[ref])
+        self.arrays[ref] = values
+        return values
+
+    def length(self, ref):
+        if ref is None:
+            raise NullPointerException("arraylength on null")
+        return len(self.arrays[ref])
+
+
+class MemoCache:
+    # Keyed by (Method, args). A Method belongs to the MethodTable of one program set, so a cache shared by
+    # interpreters over different program sets never answers a call with another set's result
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key]
+        self.misses += 1
+        return False, None
+
+    def store(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class ControlFlowGraph:
+    # Basic blocks, predecessors, dominators, natural loops and reverse postorder of one method. Graphs are
+    # cached by a hash of the bytecode, so every user of a method shares one instance
+    cache = {}
+    branches = ("goto", "if", "ifz", "return", "throw")
+
+    def __init__(self, bytecode):
+        self.bytecode = bytecode
+        self.successors = [[successor for successor in ControlFlowGraph.successors_of(pc, b) if successor < len(bytecode)]
+                           for (pc, b) in enumerate(bytecode)]
+        self.order = self.reverse_postorder()
+        self.rank = {pc: k for k, pc in enumerate(self.order)}
+        self.predecessors = {pc: [] for pc in self.order}
+        for pc in self.order:
+            for successor in self.successors[pc]:
+                self.predecessors[successor].append(pc)
+        self.leaders = self.find_leaders()
+        self.blocks = {}
+        self.block_of = {}
+        starts = set(self.leaders)
+        for leader in self.leaders:
+            pc = leader
+            self.blocks[leader] = [pc]
+            self.block_of[pc] = leader
+            while self.bytecode[pc]["opr"] not in ControlFlowGraph.branches and pc + 1 in self.rank and pc + 1 not in starts:
+                pc += 1
+                self.blocks[leader].append(pc)
+                self.block_of[pc] = leader
+        self.idom = self.dominators()
+        self.heads = {successor for pc in self.order for successor in self.successors[pc]
+                      if self.rank[successor] <= self.rank[pc]}
+        self.loops = self.natural_loops()
+
+    @staticmethod
+    def of(bytecode):
+        key = hashlib.sha256(json.dumps(bytecode, sort_keys=True).encode()).hexdigest()
+        cfg = ControlFlowGraph.cache.get(key)
+        if cfg is None:
+            cfg = ControlFlowGraph.cache[key] = ControlFlowGraph(bytecode)
+        return cfg
+
+    @staticmethod
+    def successors_of(pc, b):
+        opr = b["opr"]
+        if opr == "goto":
+            return [b["target"]]
+        if opr in ("if", "ifz"):
+            return [pc + 1, b["target"]]
+        if opr in ("return", "throw"):
+            return []
+        return [pc + 1]
+
+    def reverse_postorder(self):
+        if not self.bytecode:
+            return []
+        order, visited = [], {0}
+        stack = [(0, iter(self.successors[0]))]
+        while stack:
+            (pc, successors) = stack[-1]
+            for successor in successors:
+                if successor not in visited:
+                    visited.add(successor)
+                    stack.append((successor, iter(self.successors[successor])))
+                    break
+            else:
+                stack.pop()
+                order.append(pc)
+        order.reverse()
+        return order
+
+    def find_leaders(self):
+        leaders = {0}
+        for pc in self.order:
+            if self.bytecode[pc]["opr"] in ControlFlowGraph.branches:
+                leaders.update(self.successors[pc])
+                leaders.add(pc + 1)
+        return [pc for pc in self.order if pc in leaders]
+
+    def dominators(self):
+        # Immediate dominators of the blocks (Cooper, Harvey and Kennedy), the entry block has None
+        idom = {self.leaders[0]: self.leaders[0]} if self.leaders else {}
+        changed = True
+        while changed:
+            changed = False
+            for leader in self.leaders[1:]:
+                preds = [self.block_of[pc] for pc in self.predecessors[leader] if self.block_of[pc] in idom]
+                new = preds[0]
+                for pred in preds[1:]:
+                    new = self.intersect(idom, pred, new)
+                if idom.get(leader) != new:
+                    idom[leader] = new
+                    changed = True
+        if self.leaders:
+            idom[self.leaders[0]] = None
+        return idom
+
+    def intersect(self, idom, a, b):
+        while a != b:
+            while self.rank[a] > self.rank[b]:
+                a = idom[a]
+            while self.rank[b] > self.rank[a]:
+                b = idom[b]
+        return a
+
+    def dominates(self, a, b):
+        (block_a, block_b) = (self.block_of[a], self.block_of[b])
+        if block_a == block_b:
+            return a <= b
+        while block_b is not None and block_b != block_a:
+            block_b = self.idom[block_b]
+        return block_b == block_a
+
+    def natural_loops(self):
+        # Loop bodies by header, for back edges whose target dominates their source
+        loops = {}
+        for pc in self.order:
+            for header in self.successors[pc]:
+                if self.rank[header] <= self.rank[pc] and self.dominates(header, pc):
+                    body = loops.setdefault(header, {header})
+                    worklist = [pc]
+                    while worklist:
+                        node = worklist.pop()
+                        if node not in body:
+                            body.add(node)
+                            worklist.extend(self.predecessors[node])
+        return loops
+
+
+class Method:
+    __slots__ = ("name", "program", "code", "max_locals", "compiled", "pure")
+
+    def __init__(self, name, program, code=None):
+        self.name = name
+        self.program = program
+        if code is None:
+            code = [Interpreter.decode_instruction(b, pc) for pc, b in enumerate(program['bytecode'])]
+        self.code = code
+        self.max_locals = program.get("max_locals", 0)
+        self.compiled = None
+        self.pure = None
+
+    def new_locals(self, args):
+        lv = list(args)
+        if len(lv) < self.max_locals:
+            lv.extend([None] * (self.max_locals - len(lv)))
+        return lv
+
+
+class Frame:
+    __slots__ = ("locals", "stack", "pc", "code", "method", "memo_key")
+
+    def __init__(self, locals, stack, pc, method):
+        self.locals = locals
+        self.stack = stack
+        self.pc = pc
+        self.code = method.code
+        self.method = method
+        self.memo_key = None
+
+    def __repr__(self):
+        return repr((self.locals, self.stack, self.pc))
+
+
+class MethodTable(dict):
+    # Methods of avail_programs, decoded the first time they are called. Purity needs the whole call graph,
+    # so mark_purity decodes everything, and only runs when memoization asks for it. An entry program is
+    # matched to its name by identity; ones that are not among avail_programs are kept in a small side table,
+    # so decoded code lives only as long as its table. method_code, when set, is asked for a program's decoded
+    # code before it is decoded here, and may return None
+    unnamed_limit = 256
+
+    def __init__(self, avail_programs):
+        super().__init__()
+        self.avail_programs = avail_programs
+        self.by_program = {}
+        self.unnamed = {}
+        self.purity_marked = False
+        self.method_code = None
+
+    def __missing__(self, name):
+        program = self.avail_programs[name]
+        code = self.method_code(program) if self.method_code is not None else None
+        return self.add(Method(name, program, code))
+
+    def add(self, method):
+        # Methods keep their program alive, so its id stays unique while the method is in the table
+        self[method.name] = method
+        self.by_program[id(method.program)] = method
+        return method
+
+    def entry(self, program):
+        method = self.by_program.get(id(program)) or self.unnamed.get(id(program))
+        if method is not None and method.program is program:
+            return method
+        # Lazy mappings expose what they have parsed so far, which includes any program looked up by name
+        for name, value in getattr(self.avail_programs, "loaded", self.avail_programs).items():
+            if value is program:
+                return self[name]
+        method = Method(None, program)
+        if len(self.unnamed) >= MethodTable.unnamed_limit:
+            del self.unnamed[next(iter(self.unnamed))]
+        self.unnamed[id(program)] = method
+        return method
+
+    def mark_purity(self):
+        if not self.purity_marked or len(self) != len(self.avail_programs):
+            for name in self.avail_programs:
+                self[name]
+            Interpreter.mark_purity(self)
+            self.purity_marked = True
+
+
 class Interpreter:
-    def __init__(self, program, verbose, avail_programs):
+    method_tables = OrderedDict()
+    method_table_limit = 16
+
+    INTERPRET = "interpret"
+    COMPILED = "compiled"
+    compiled_depth = 100
+
+    def __init__(self, program, verbose, avail_programs, trace=None, mode=INTERPRET, memo=None, limits=None,
+                 profile=None):
         self.program = program
         self.verbose = verbose
         self.avail_programs = avail_programs
-        self.memory = []
+        self.mode = mode
+        self.memo = memo
+        self.limits = limits
+        self.fuel = None
+        self.deadline = None
+        self.countdown = 0
+        self.outcome = None
+        self.depth = 0
+        self.profile = profile
+        if trace is None and verbose:
+            trace = Trace(Trace.INSTRUCTION, FileSink(sys.stdout))
+        self.trace = trace
+        self.methods = Interpreter.method_table(avail_programs)
+        if memo is not None:
+            self.methods.mark_purity()
+        self.method = self.methods.entry(program)
+        self.memory = Heap()
         self.stack = []
 
+    @property
+    def memory(self):
+        return self.heap
+
+    @memory.setter
+    def memory(self, arrays):
+        self.heap = arrays if isinstance(arrays, Heap) else Heap(arrays)
+
+    @staticmethod
+    def method_table(avail_programs):
+        # The most recently used tables are kept, so long fuzzing or benchmark runs do not hold on to every
+        # program set they have seen
+        tables = Interpreter.method_tables
+        table = tables.get(id(avail_programs))
+        if table is None or table.avail_programs is not avail_programs:
+            table = tables[id(avail_programs)] = MethodTable(avail_programs)
+            if len(tables) > Interpreter.method_table_limit:
+                tables.popitem(last=False)
+        tables.move_to_end(id(avail_programs))
+        return table
+
+    @staticmethod
+    def mark_purity(methods):
+        # A method is pure when its result depends only on its arguments: no heap access, no builtins
+        # (which print) and only calls to other pure methods. Impurity is propagated to callers.
+        impure = (Interpreter._get, Interpreter._invoke_builtin, Interpreter._unknown, Interpreter._newarray,
+                  Interpreter._array_load, Interpreter._array_store, Interpreter._arraylength)
+        calls = {}
+        for name, method in methods.items():
+            method.pure = not any(handler in impure for handler, _ in method.code)
+            calls[name] = [operands[0] for handler, operands in method.code if handler is Interpreter._invoke]
+        changed = True
+        while changed:
+            changed = False
+            for name, method in methods.items():
+                if method.pure and any(callee not in methods or not methods[callee].pure for callee in calls[name]):
+                    method.pure = False
+                    changed = True
+
+    @staticmethod
+    def decode_instruction(b, pc=0):
+        handler, operands = Interpreter.decode_operands(b)
+        if b["opr"] in ("goto", "if", "ifz") and b["target"] <= pc and handler is not Interpreter._unknown:
+            # Backward branches charge the limits with the length of the loop they close
+            return Interpreter._backward, (handler, operands, pc - b["target"] + 1)
+        return handler, operands
+
+    @staticmethod
+    def decode_operands(b):
+        opr = b["opr"]
+        handler = getattr(Interpreter, "_" + opr, None)
+        if handler is None:
+            return Interpreter._unknown, b
+        if opr == "return":
+            operands = b["type"]
+        elif opr == "push":
+            operands = (b["value"] or {}).get("value")
+        elif opr in ("load", "store"):
+            operands = b["index"]
+        elif opr == "binary":
+            operation = getattr(ArithmeticOperation, "_" + b["operant"], None)
+            if operation is None:
+                return Interpreter._unknown, b
+            operands = operation
+        elif opr in ("if", "ifz"):
+            condition = getattr(Comparison, "_" + b["condition"], None)
+            if condition is None:
+                return Interpreter._unknown, b
+            operands = (condition, b["target"])
+        elif opr == "incr":
+            operands = (b["index"], b["amount"])
+        elif opr == "goto":
+            operands = b["target"]
+        elif opr == "get":
+            operands = JavaMethod._get(b["field"])
+        elif opr == "invoke":
+            method = b["method"]
+            builtin = getattr(JavaMethod, "_" + method["name"], None)
+            if builtin is None:
+                return Interpreter._invoke, (method["name"], len(method["args"]), method["returns"])
+            ref_name = (method.get("ref") or {}).get("name")
+            handler = Interpreter._invoke_builtin
+            operands = (builtin, method["name"], len(method["args"]), b["access"], ref_name, method["returns"])
+        elif opr == "dup":
+            operands = b["words"]
+        elif opr == "newarray":
+            operands = (b["type"], b.get("dim", 1))
+        else:
+            operands = None
+        return handler, operands
+
     def run(self, f):
+        # Frames left behind by a run that stopped on a limit or an exception must not be resumed
+        self.stack.clear()
+        self.depth = 0
+        if self.limits is not None:
+            self.fuel = self.limits.steps
+            self.deadline = None if self.limits.seconds is None else time.monotonic() + self.limits.seconds
+            self.countdown = self.limits.check_every
+            self.heap.limit = self.limits.heap_bytes
+        try:
+            value = self.dispatch(f)
+        except LimitExceeded as limit:
+            self.outcome = limit.outcome
+            return None
+        self.outcome = Outcome(Outcome.RETURNED, value)
+        return value
+
+    def dispatch(self, f):
+        if not isinstance(f, Frame):
+            (lv, os, pc) = f
+            f = Frame(self.method.new_locals(lv), list(os), pc, self.method)
+            if self.memo is not None and self.method.pure and pc == 0 and not os:
+                f.memo_key = (self.method, tuple(lv))
+                found, value = self.memo.lookup(f.memo_key)
+                if found:
+                    return value
+        if self.profile is not None:
+            self.stack.append(f)
+            return self.execute_profiled(self.profile)
+        if self.trace is None or self.trace.level == Trace.OFF:
+            if self.mode == Interpreter.COMPILED and self.limits is None and f.pc == 0 and not f.stack:
+                compiled = BlockCompiler.compile(f.method)
+                if compiled is not None:
+                    value = compiled(self, *f.locals)
+                    if f.memo_key is not None:
+                        self.memo.store(f.memo_key, value)
+                    return value
+            self.stack.append(f)
+            return self.execute()
         self.stack.append(f)
-        print("--- Starting execution... ---")
-        while True:
-            end_of_program, return_value = self.step()
-            print("Stack: ", self.stack)
-            print("Memory: ", self.memory)
-            if return_value != None:
-                print(return_value)
+        return self.execute_traced(self.trace)
+
+    def call(self, name, *args):
+        method = self.methods[name]
+        if self.memo is not None and method.pure:
+            found, value = self.memo.lookup((method, args))
+            if found:
+                return value
+        compiled = None
+        if self.mode == Interpreter.COMPILED and self.limits is None and self.depth < Interpreter.compiled_depth:
+            compiled = BlockCompiler.compile(method)
+        if compiled is not None:
+            # Compiled calls nest Python frames; past compiled_depth the callee runs in the frame loop instead,
+            # whose own calls push frames, so recursion depth is bounded by memory as in INTERPRET mode
+            self.depth += 1
+            try:
+                value = compiled(self, *args)
+            finally:
+                self.depth -= 1
+            if self.memo is not None and method.pure:
+                self.memo.store((method, args), value)
+            return value
+        f = Frame(method.new_locals(args), [], 0, method)
+        if self.memo is not None and method.pure:
+            f.memo_key = (method, args)
+        self.stack.append(f)
+        return self.execute()
+
+    def execute(self):
+        stack = self.stack
+        while stack:
+            f = stack[-1]
+            handler, operands = f.code[f.pc]
+            return_value = handler(self, f, operands)
+            if return_value is not None:
                 return return_value
-            if end_of_program:
-                break
-        print('--- Done ---')
         return None
 
-    def step(self):
-        if len(self.stack) == 0:
-            return True, None
-        (_, _, pc) = self.stack[-1]
-        b = self.program['bytecode'][pc]
-        if self.verbose:
-            print("Starting...: ", b)
-        if hasattr(self, "_"+b["opr"]):
-            return False, getattr(self, "_"+b["opr"])(b)
-        else:
-            print("Unknown instruction: ", b)
-            return True, None
+    def execute_traced(self, trace):
+        stack = self.stack
+        every = trace.every
+        trace.start(stack[-1])
+        return_value = None
+        while stack:
+            f = stack[-1]
+            pc = f.pc
+            handler, operands = f.code[pc]
+            try:
+                return_value = handler(self, f, operands)
+            except Exception as error:
+                trace.failed(pc, error)
+                raise
+            trace.steps += 1
+            if every and trace.steps % every == 0:
+                trace.instruction(f, pc)
+            if return_value is not None:
+                break
+        trace.done(return_value)
+        return return_value
+
+    def execute_profiled(self, profile):
+        stack = self.stack
+        clock = time.perf_counter_ns
+        opcodes, pcs, calls, stacks = profile.opcodes, profile.pcs, profile.calls, profile.stacks
+        nodes = [profile.node(-1, stack[-1].method.name or "<main>")]
+        return_value = None
+        while stack:
+            f = stack[-1]
+            pc = f.pc
+            depth = len(stack)
+            handler, operands = f.code[pc]
+            start = clock()
+            return_value = handler(self, f, operands)
+            elapsed = clock() - start
+
+            if handler is Interpreter._backward:
+                handler = operands[0]
+            entry = opcodes.get(handler)
+            if entry is None:
+                opcodes[handler] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+            counts = pcs.get(f.method.name)
+            if counts is None:
+                counts = pcs[f.method.name] = [0] * len(f.code)
+            counts[pc] += 1
+            node = nodes[depth - 1]
+            stacks[node] = stacks.get(node, 0) + elapsed
+
+            if len(stack) > depth:
+                callee = stack[-1].method.name
+                calls[(f.method.name, callee)] = calls.get((f.method.name, callee), 0) + 1
+                nodes.append(profile.node(node, callee))
+            elif len(stack) < depth:
+                del nodes[len(stack):]
+            elif handler is Interpreter._invoke_builtin:
+                calls[(f.method.name, operands[1])] = calls.get((f.method.name, operands[1]), 0) + 1
+            if return_value is not None:
+                break
+        return return_value
 
-    def _return(self, b):
-        (_, os, _) = self.stack.pop(-1)
-        if b["type"] == None:
+    def _unknown(self, f, b):
+        print("Unknown instruction: ", b)
+        self.stack.clear()
+
+    def _return(self, f, type):
+        stack = self.stack
+        stack.pop()
+        value = None if type == None else f.stack[-1]
+        if f.memo_key is not None:
+            self.memo.store(f.memo_key, value)
+        if stack:
+            if type != None:
+                stack[-1].stack.append(value)
             return None
-        elif b["type"] == "int":
-            return os[-1]
+        return value
         
-    def _push(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        value = b["value"]
-        self.stack.append((lv, os + [value["value"]], pc + 1))
-
-    def _load(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        if b["type"] == "ref":
-            value = lv[b["index"]]
-            self.stack.append((lv, os + [value], pc + 1))
-        else:
-            value = lv[b["index"]]
-            self.stack.append((lv, os + [value], pc + 1))
-
-    def _binary(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        value = getattr(ArithmeticOperation, "_"+b["operant"])(os[-2], os[-1])
-        self.stack.append((lv, os[:-2] + [value], pc + 1))
-
-    def _if(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        condition = getattr(Comparison, "_"+b["condition"])(os[-2], os[-1])
-        if condition:
-            pc = b["target"]
-        else:
-            pc = pc + 1
-        self.stack.append((lv, os[:-2], pc))
-
-    def _store(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        value = os[-1]
-        if b["index"] >= len(lv):
-            lv = lv + [value]
+    def _push(self, f, value):
+        f.stack.append(value)
+        f.pc += 1
+
+    def _load(self, f, index):
+        f.stack.append(f.locals[index])
+        f.pc += 1
+
+    def _binary(self, f, operation):
+        os = f.stack
+        b = os.pop()
+        os[-1] = operation(os[-1], b)
+        f.pc += 1
+
+    def _if(self, f, operands):
+        (condition, target) = operands
+        os = f.stack
+        b = os.pop()
+        if condition(os.pop(), b):
+            f.pc = target
         else:
-            lv[b["index"]] = value
-        self.stack.append((lv, os[:-1], pc + 1))
-
-    def _incr(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        lv[b["index"]] = lv[b["index"]] + b["amount"]
-        self.stack.append((lv, os, pc + 1))
-
-    def _ifz(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        condition = getattr(Comparison, "_"+b["condition"])(os[-1], 0)
-        if condition:
-            pc = b["target"]
+            f.pc += 1
+
+    def _store(self, f, index):
+        lv = f.locals
+        if index >= len(lv):
+            lv.extend([None] * (index + 1 - len(lv)))
+        lv[index] = f.stack.pop()
+        f.pc += 1
+
+    def _incr(self, f, operands):
+        (index, amount) = operands
+        f.locals[index] += amount
+        f.pc += 1
+
+    def _ifz(self, f, operands):
+        (condition, target) = operands
+        if condition(f.stack.pop(), 0):
+            f.pc = target
         else:
-            pc = pc + 1
-        self.stack.append((lv, os[:-1], pc))
-
-    def _goto(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        value = b["target"]
-        pc = value
-        self.stack.append((lv, os, pc))
+            f.pc += 1
+
+    def _goto(self, f, target):
+        f.pc = target
+
+    def _backward(self, f, operands):
+        (handler, inner, cost) = operands
+        if self.limits is not None:
+            self.charge(cost, f.method.name)
+        handler(self, f, inner)
+
+    def charge(self, cost, where):
+        if self.fuel is not None:
+            self.fuel -= cost
+            if self.fuel < 0:
+                raise LimitExceeded(Outcome.FUEL_EXHAUSTED, f"step budget of {self.limits.steps} exhausted in {where}")
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self.countdown = self.limits.check_every
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                raise LimitExceeded(Outcome.TIMEOUT, f"deadline of {self.limits.seconds}s passed in {where}")
+            if self.limits.cancel is not None and self.limits.cancel():
+                raise LimitExceeded(Outcome.CANCELLED, f"cancelled in {where}")
         
-    def _get(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        value = getattr(JavaMethod, "_get")(b["field"])
-        self.stack.append((lv, os + [value], pc + 1))
+    def _get(self, f, value):
+        f.stack.append(value)
+        f.pc += 1
 
-    def _invoke(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        arg_num = len(b["method"]["args"])
+    def _invoke(self, f, operands):
+        (name, arg_num, returns) = operands
+        if self.limits is not None:
+            self.charge(1, name)
+        callee = self.methods[name]
+        os = f.stack
+        args = os[len(os)-arg_num:]
+        del os[len(os)-arg_num:]
+        f.pc += 1
+        callee_frame = Frame(callee.new_locals(args), [], 0, callee)
+        if self.memo is not None and callee.pure:
+            callee_frame.memo_key = (callee, tuple(args))
+            found, value = self.memo.lookup(callee_frame.memo_key)
+            if found:
+                if returns != None:
+                    os.append(value)
+                return
+        self.stack.append(callee_frame)
 
-        try:
-            if hasattr(JavaMethod, "_" + b["method"]["name"]):
-                if arg_num == 0:
-                    value = getattr(JavaMethod, "_" + b["method"]["name"])([])
-                else:    
-                    value = getattr(JavaMethod, "_" + b["method"]["name"])(*os[-arg_num:])
-                if b["access"] != "dynamic":
-                    if b["method"]["ref"]["name"] == os[-arg_num-1]:
-                        self.stack.append((lv, os[:-arg_num-1] + [value], pc + 1))
-                    else:
-                        raise Exception
-            else:
-                raise Exception
-        except:
-            interpret = Interpreter(self.avail_programs[b["method"]["name"]], self.verbose, self.avail_programs)
-            if arg_num == 0:
-                (l_new, s_new, pc_new) = [], [], 0
-            else:
-                (l_new, s_new, pc_new) = os[-arg_num:], [], 0
-            ret = interpret.run((l_new, s_new, pc_new))
-            if b["method"]["returns"] == None:
-                if arg_num == 0:
-                    self.stack.append((lv, os, pc + 1))
-                else:
-                    self.stack.append((lv, os[:-arg_num], pc + 1))
-            else:
-                if arg_num == 0:
-                    self.stack.append((lv, os + [ret], pc + 1))
-                else:
-                    self.stack.append((lv, os[:-arg_num] + [ret], pc + 1))
-
-    def _array_load(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        index_el = os[-1]
-        index_array = os[-2]
-        value = self.memory[index_array][index_el]
-        self.stack.append((lv, os[:-2] + [value], pc + 1))
-
-    def _array_store(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        value = os[-1]
-        index_of_array = os[-3]
-        index_of_el = os[-2]
-        if len(self.memory[index_of_array]) <= index_of_el:
-            self.memory[index_of_array].append(value)
-        else:
-            self.memory[index_of_array][index_of_el] = value
-        self.stack.append((lv, os[:-3], pc + 1))
+    def _invoke_builtin(self, f, operands):
+        (builtin, name, arg_num, access, ref_name, returns) = operands
+        os = f.stack
+        if access != "dynamic" and os[-arg_num-1] != ref_name:
+            return self._invoke(f, (name, arg_num, returns))
+        args = os[len(os)-arg_num:]
+        del os[len(os)-arg_num:]
+        value = builtin(*args)
+        if access != "dynamic":
+            os.pop()
+        if returns != None:
+            os.append(value)
+        f.pc += 1
+
+    def _array_load(self, f, _):
+        os = f.stack
+        index = os.pop()
+        os[-1] = self.heap.load(os[-1], index)
+        f.pc += 1
+
+    def _array_store(self, f, _):
+        os = f.stack
+        value = os.pop()
+        index = os.pop()
+        self.heap.store(os.pop(), index, value)
+        f.pc += 1
 
-    def _newarray(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        self.memory.append([])
-        self.stack.append((lv, os + [len(self.memory)-1], pc + 1))
+    def _newarray(self, f, operands):
+        (type, dim) = operands
+        os = f.stack
+        sizes = os[len(os)-dim:]
+        del os[len(os)-dim:]
+        os.append(self.heap.allocate(type, sizes))
+        f.pc += 1
     
-    def _dup(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        self.stack.append((lv, os + os[-b["words"]:], pc + 1))
+    def _dup(self, f, words):
+        f.stack.extend(f.stack[-words:])
+        f.pc += 1
+
+    def _arraylength(self, f, _):
+        os = f.stack
+        os[-1] = self.heap.length(os[-1])
+        f.pc += 1
+
+
+class BlockCompiler:
+    operators = {"add": "+", "sub": "-", "mul": "*", "div": "//", "mod": "%"}
+    comparisons = {"gt": ">", "ge": ">=", "le": "<="}
+
+    def __init__(self, method):
+        self.method = method
+        self.bytecode = method.program['bytecode']
+        self.cfg = ControlFlowGraph.of(self.bytecode)
+        self.namespace = {}
+
+    @staticmethod
+    def compile(method):
+        # Methods using instructions the compiler does not handle are remembered as False and stay interpreted
+        if method.compiled is None:
+            method.compiled = BlockCompiler(method).build() or False
+        return method.compiled or None
+
+    def stack_effect(self, b):
+        opr = b["opr"]
+        if opr in ("push", "load", "get"):
+            return 0, 1
+        if opr == "newarray":
+            return b.get("dim", 1), 1
+        if opr in ("binary", "array_load"):
+            return 2, 1
+        if opr == "if":
+            return 2, 0
+        if opr in ("ifz", "store"):
+            return 1, 0
+        if opr in ("incr", "goto"):
+            return 0, 0
+        if opr == "arraylength":
+            return 1, 1
+        if opr == "array_store":
+            return 3, 0
+        if opr == "dup":
+            return 0, b["words"]
+        if opr == "return":
+            return (0 if b["type"] == None else 1), 0
+        if opr == "invoke":
+            method = b["method"]
+            pops = len(method["args"])
+            if hasattr(JavaMethod, "_" + method["name"]) and b["access"] != "dynamic":
+                pops += 1
+            return pops, (0 if method["returns"] == None else 1)
+        return None
+
+    def supported(self, b):
+        opr = b["opr"]
+        if opr == "binary":
+            return b["operant"] in BlockCompiler.operators
+        if opr in ("if", "ifz"):
+            return b["condition"] in BlockCompiler.comparisons
+        return self.stack_effect(b) is not None
+
+    def depths(self):
+        depths = {0: 0}
+        worklist = [0]
+        while worklist:
+            pc = worklist.pop()
+            if pc >= len(self.bytecode):
+                return None
+            b = self.bytecode[pc]
+            if not self.supported(b):
+                return None
+            (pops, pushes) = self.stack_effect(b)
+            depth = depths[pc] - pops + pushes
+            if depth < 0:
+                return None
+            for successor in ControlFlowGraph.successors_of(pc, b):
+                if successor not in depths:
+                    depths[successor] = depth
+                    worklist.append(successor)
+                elif depths[successor] != depth:
+                    return None
+        return depths
 
-    def _arraylength(self, b):
-        (lv, os, pc) = self.stack.pop(-1)
-        index_array = os[-1]
-        value = len(self.memory[index_array])
-        self.stack.append((lv, os[:-1] + [value], pc + 1))    
+    def constant(self, value):
+        if value is None or isinstance(value, (bool, int, str)):
+            return repr(value)
+        name = f"c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def instruction(self, pc, b, d):
+        opr = b["opr"]
+        if opr == "push":
+            return [f"s{d} = {self.constant((b['value'] or {}).get('value'))}"]
+        if opr == "load":
+            return [f"s{d} = l{b['index']}"]
+        if opr == "get":
+            return [f"s{d} = {self.constant(JavaMethod._get(b['field']))}"]
+        if opr == "binary":
+            return [f"s{d-2} = s{d-2} {BlockCompiler.operators[b['operant']]} s{d-1}"]
+        if opr == "store":
+            return [f"l{b['index']} = s{d-1}"]
+        if opr == "incr":
+            return [f"l{b['index']} += {b['amount']}"]
+        if opr == "array_load":
+            return [f"s{d-2} = memory.load(s{d-2}, s{d-1})"]
+        if opr == "array_store":
+            return [f"memory.store(s{d-3}, s{d-2}, s{d-1})"]
+        if opr == "newarray":
+            dim = b.get("dim", 1)
+            sizes = ", ".join(f"s{k}" for k in range(d - dim, d))
+            return [f"s{d-dim} = memory.allocate({b['type']!r}, [{sizes}])"]
+        if opr == "arraylength":
+            return [f"s{d-1} = memory.length(s{d-1})"]
+        if opr == "dup":
+            words = b["words"]
+            return [f"s{d+k} = s{d-words+k}" for k in range(words)]
+        if opr == "invoke":
+            method = b["method"]
+            (pops, pushes) = self.stack_effect(b)
+            args = ", ".join(f"s{k}" for k in range(d - len(method["args"]), d))
+            builtin = getattr(JavaMethod, "_" + method["name"], None)
+            if builtin is not None:
+                call = f"{self.constant(builtin)}({args})"
+            else:
+                call = f"interp.call({method['name']!r}{', ' if args else ''}{args})"
+            return [f"s{d-pops} = {call}" if pushes else call]
+        if opr == "return":
+            return ["return None" if b["type"] == None else f"return s{d-1}"]
+        if opr == "goto":
+            return [f"block = {b['target']}"]
+        condition = BlockCompiler.comparisons[b["condition"]]
+        if opr == "if":
+            return [f"block = {b['target']} if s{d-2} {condition} s{d-1} else {pc + 1}"]
+        return [f"block = {b['target']} if s{d-1} {condition} 0 else {pc + 1}"]
+
+    def build(self):
+        depths = self.depths()
+        if depths is None:
+            return None
+        leaders = [pc for pc in self.cfg.leaders if pc in depths]
+        starts = set(leaders)
+        indices = [b["index"] for b in self.bytecode if b["opr"] in ("load", "store", "incr")]
+        local_count = max([self.method.max_locals] + [index + 1 for index in indices])
+        params = "".join(f", l{k}=None" for k in range(local_count))
+        # Callers may pass more locals than the method uses; the extra ones are never read
+        lines = [f"def compiled(interp{params}, *_):",
+                 "    memory = interp.memory",
+                 "    block = 0",
+                 "    while True:"]
+        for k, leader in enumerate(leaders):
+            lines.append(f"        {'if' if k == 0 else 'elif'} block == {leader}:")
+            pc = leader
+            while True:
+                b = self.bytecode[pc]
+                lines.extend("            " + line for line in self.instruction(pc, b, depths[pc]))
+                if b["opr"] in ("goto", "if", "ifz", "return"):
+                    break
+                pc += 1
+                if pc in starts:
+                    lines.append(f"            block = {pc}")
+                    break
+        source = "\n".join(lines) + "\n"
+        exec(compile(source, f"<compiled {self.method.name}>", "exec"), self.namespace)
+        return self.namespace["compiled"]
 
 
 
@@ -250,13 +1112,156 @@ def get_functions(json_obj):
     return functions
 
 
-def analyse_bytecode(folder_path, target_folder_path):
-    class_files = glob.glob(folder_path + '/**/*.class', recursive=True)
-    for class_file in class_files:
-        json_file = pathlib.Path(class_file).with_suffix('.json').name
-        target_file = pathlib.Path(target_folder_path) / json_file
-        command = ["jvm2json", "-s", class_file, "-t", str(target_file)]
-        subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+def file_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def convert_class(class_file, target_file):
+    # jvm2json writes next to the target, which is only replaced when the conversion succeeds
+    temporary = f"{target_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    command = ["jvm2json", "-s", class_file, "-t", temporary]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as error:
+        return str(error)
+    if result.returncode != 0:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return f"exit code {result.returncode}: {result.stderr.decode(errors='replace').strip()}"
+    os.replace(temporary, target_file)
+    return None
+
+class LazyFunctions(Mapping):
+    # The @Case methods of one class file; a method's code JSON is parsed the first time it is looked up
+    def __init__(self, sources):
+        self.sources = sources
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            self.loaded[name] = json.loads(self.sources[name])
+        return self.loaded[name]
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
+
+def method_spans(text):
+    # Yields (start, end) of each object in the top-level methods array. Every method starts with the same
+    # first key, so the next one is found with str.find and accepted once the braces in between balance.
+    # Braces inside strings are not told apart. An unbalanced one moves every later boundary, so the last
+    # span has to end at the closing bracket of the array; spans merged by it fail when callers parse them
+    methods = re.search(r'"methods"\s*:\s*\[\s*', text)
+    if methods is None:
+        raise ValueError("no methods array")
+    start = methods.end()
+    if text.startswith("]", start):
+        return
+    first_key = re.compile(r'\{\s*"[^"]*"\s*:').match(text, start)
+    if first_key is None:
+        raise ValueError(f"no method object at {start}")
+    prefix = first_key.group()
+    while True:
+        # The brace balance is carried from one candidate to the next, so each character is counted once
+        (candidate, position, depth) = (text.find(prefix, start + 1), start, 0)
+        while candidate >= 0:
+            depth += text.count("{", position, candidate) - text.count("}", position, candidate)
+            if depth == 0:
+                break
+            position = candidate
+            candidate = text.find(prefix, candidate + 1)
+        if candidate < 0:
+            end = object_end(text, start)
+            if not text[end:].lstrip().startswith("]"):
+                raise ValueError(f"methods array does not end after method at {start}")
+            yield (start, end)
+            return
+        end = text.rindex("}", start, candidate) + 1
+        if text[end:candidate].strip() != ",":
+            raise ValueError(f"unexpected text after method at {end}")
+        yield (start, end)
+        start = candidate
+
+def object_end(text, start):
+    (depth, position) = (0, start)
+    while True:
+        close = text.find("}", position)
+        if close < 0:
+            raise ValueError(f"unterminated object at {start}")
+        depth += text.count("{", position, close) - 1
+        position = close + 1
+        if depth == 0:
+            return position
+
+def code_span(text, start, end):
+    # The span of the code object directly inside the method object at start
+    depth = 0
+    for match in re.compile(r'[{}]').finditer(text, start, end):
+        brace = match.start()
+        if text[brace] == "}":
+            depth -= 1
+        elif depth == 1 and re.search(r'"code"\s*:\s*$', text[max(start, brace - 16):brace]):
+            return (brace, object_end(text, brace))
+        else:
+            depth += 1
+    return None
+
+def load_functions(file_path):
+    # Like get_functions(json.load(file)), but only the headers of methods mentioning the Case annotation
+    # are parsed up front. Falls back to a full parse when the method spans do not parse
+    with open(file_path, 'r') as file:
+        text = file.read()
+    try:
+        sources = {}
+        for (start, end) in method_spans(text):
+            if text.find('dtu/compute/exec/Case', start, end) < 0:
+                continue
+            code = code_span(text, start, end)
+            header = text[start:code[0]] + 'null' + text[code[1]:end] if code else text[start:end]
+            func = json.loads(header)
+            if any(anno['type'] == 'dtu/compute/exec/Case' for anno in func['annotations']):
+                sources[func['name']] = text[code[0]:code[1]] if code else json.dumps(func['code'])
+        return LazyFunctions(sources)
+    except (ValueError, KeyError, TypeError):
+        return get_functions(json.loads(text))
+
+def analyse_bytecode(folder_path, target_folder_path, workers=None):
+    # Converts every .class under folder_path with jvm2json in a bounded thread pool. Classes converted
+    # successfully before are skipped when their .json is newer or their content hash is unchanged. A failed
+    # conversion keeps the previous .json but loses its manifest entry, so it is retried on the next run.
+    # Returns the failures as a {class file: message} dict
+    target_folder = pathlib.Path(target_folder_path)
+    target_folder.mkdir(parents=True, exist_ok=True)
+    manifest_path = target_folder / ".jvm2json-hashes.json"
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    jobs = []
+    for class_file in sorted(glob.glob(folder_path + '/**/*.class', recursive=True)):
+        target_file = target_folder / pathlib.Path(class_file).with_suffix('.json').name
+        if target_file.exists() and class_file in manifest:
+            if target_file.stat().st_mtime >= pathlib.Path(class_file).stat().st_mtime:
+                continue
+            digest = file_hash(class_file)
+            if manifest.get(class_file) == digest:
+                continue
+        else:
+            digest = file_hash(class_file)
+        jobs.append((class_file, target_file, digest))
+
+    failures = {}
+    if jobs:
+        with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+            results = pool.map(lambda job: convert_class(job[0], job[1]), jobs)
+            for (class_file, _, digest), error in zip(jobs, results):
+                if error is None:
+                    manifest[class_file] = digest
+                else:
+                    manifest.pop(class_file, None)
+                    failures[class_file] = error
+                    print(f"jvm2json failed for {class_file}: {error}", file=sys.stderr)
+        manifest_path.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    return failures
 
 
 def main():
@@ -265,13 +1270,11 @@ def main():
     analyse_bytecode(folder_path, target_folder_path)
 
     file_path = "../course-02242-examples/decompiled/dtu/compute/exec/Simple.json"
-    with open(file_path, 'r') as file:
-        json_obj = json.load(file)
-        byte_codes = get_functions(json_obj)
+    byte_codes = load_functions(file_path)
 
-        interpreter = Interpreter(byte_codes['main'], False, byte_codes)
-        interpreter.memory = []
-        ret = interpreter.run(([], [], 0))
+    interpreter = Interpreter(byte_codes['main'], False, byte_codes, Trace(Trace.SUMMARY, FileSink(sys.stdout)))
+    interpreter.memory = []
+    ret = interpreter.run(([], [], 0))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import glob
+import time
+import random
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from interpreter import Interpreter, Limits, Outcome, get_functions
+from image import ProgramImage
+
+
+worker_byte_codes = None
+worker_limits = None
+
+
+def load_cases(folder_path):
+    byte_codes, signatures = {}, {}
+    for path in glob.glob(folder_path + '/**/*.json', recursive=True):
+        with open(path, 'r') as file:
+            json_obj = json.load(file)
+        byte_codes.update(get_functions(json_obj))
+        for method in json_obj['methods']:
+            if method['name'] in byte_codes:
+                signatures[method['name']] = [param['type'].get('base') for param in method['params']]
+    return byte_codes, signatures
+
+
+class ImageSignatures(Mapping):
+    # Parameter base types of a program image's methods, read from a method's header when first asked for
+    def __init__(self, byte_codes):
+        self.byte_codes = byte_codes
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            self.loaded[name] = [param['type'].get('base') for param in self.byte_codes.header(name)['params']]
+        return self.loaded[name]
+
+    def __iter__(self):
+        return iter(self.byte_codes)
+
+    def __len__(self):
+        return len(self.byte_codes)
+
+
+def load_image_cases(image_path):
+    # Workers receive the image by path and map it themselves, so nothing is decoded before a job needs it
+    byte_codes = ProgramImage(image_path)
+    return byte_codes, ImageSignatures(byte_codes)
+
+
+def init_worker(byte_codes, limits):
+    global worker_byte_codes, worker_limits
+    worker_byte_codes = byte_codes
+    worker_limits = limits
+
+
+def run_job(job):
+    # job is (index, method name, locals, memory, expected); expected is None when there is nothing to compare
+    (index, name, locals, memory, expected) = job
+    interpret = Interpreter(worker_byte_codes[name], False, worker_byte_codes, limits=worker_limits)
+    interpret.memory = memory or []
+    result = {"job": index, "name": name, "value": None, "error": None}
+    start = time.perf_counter()
+    try:
+        result["value"] = interpret.run((list(locals), [], 0))
+        if interpret.outcome.status != Outcome.RETURNED:
+            result["status"] = interpret.outcome.status
+            result["error"] = interpret.outcome.message
+        elif expected is None:
+            result["status"] = "ok"
+        else:
+            result["status"] = "pass" if result["value"] == expected else "fail"
+    except Exception as error:
+        result["status"] = "error"
+        result["error"] = repr(error)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_chunk(jobs):
+    return [run_job(job) for job in jobs]
+
+
+class Runner:
+    def __init__(self, byte_codes, workers=None, max_steps=100000, max_seconds=10, chunksize=64):
+        self.byte_codes = byte_codes
+        if workers is None:
+            workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        self.workers = workers
+        self.limits = Limits(steps=max_steps, seconds=max_seconds)
+        self.chunksize = chunksize
+
+    def chunks(self, jobs):
+        chunk = []
+        for index, job in enumerate(jobs):
+            (name, locals, memory, expected) = job
+            chunk.append((index, name, locals, memory, expected))
+            if len(chunk) == self.chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def stream(self, jobs):
+        # Jobs are (method name, locals, memory, expected) tuples; results are yielded as chunks complete,
+        # with at most a few chunks per worker in flight so arbitrarily long job iterators stay bounded
+        chunks = self.chunks(jobs)
+        with ProcessPoolExecutor(self.workers, initializer=init_worker,
+                                 initargs=(self.byte_codes, self.limits)) as pool:
+            in_flight = set()
+            for chunk in chunks:
+                in_flight.add(pool.submit(run_chunk, chunk))
+                if len(in_flight) >= self.workers * 4:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in in_flight:
+                yield from future.result()
+
+    def run(self, jobs):
+        summary = {"jobs": 0, "statuses": {}, "methods": {}, "failures": [], "seconds": 0.0}
+        start = time.perf_counter()
+        for result in self.stream(jobs):
+            summary["jobs"] += 1
+            summary["statuses"][result["status"]] = summary["statuses"].get(result["status"], 0) + 1
+            method = summary["methods"].setdefault(result["name"], {"jobs": 0, "seconds": 0.0})
+            method["jobs"] += 1
+            method["seconds"] += result["seconds"]
+            if result["status"] not in ("pass", "ok"):
+                summary["failures"].append(result)
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+
+
+def random_jobs(byte_codes, signatures, count):
+    for name in sorted(byte_codes):
+        if all(base == "int" for base in signatures.get(name, [None])):
+            for _ in range(count):
+                locals = [random.randint(-2**31, 2**31 - 1) for _ in signatures[name]]
+                yield (name, locals, None, None)
+
+
+def main():
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else "../course-02242-examples/decompiled/dtu/compute/exec/"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    if os.path.isfile(folder_path):
+        byte_codes, signatures = load_image_cases(folder_path)
+    else:
+        byte_codes, signatures = load_cases(folder_path)
+    summary = Runner(byte_codes).run(random_jobs(byte_codes, signatures, count))
+    print(f"{summary['jobs']} jobs in {summary['seconds']:.2f}s: {summary['statuses']}")
+    for name, method in sorted(summary["methods"].items()):
+        print(f"  {name}: {method['jobs']} jobs, {method['seconds']:.3f}s")
+    for failure in summary["failures"][:20]:
+        print(f"  {failure['status']}: {failure['name']} job {failure['job']} {failure['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,7 @@ import random
 import sys
 import math
 import glob
-import subprocess
-import pathlib
-from interpreter import Interpreter
+from interpreter import analyse_bytecode, get_functions, load_functions, Interpreter, MemoCache, Heap, Profiler, Limits, Outcome, ArrayIndexOutOfBoundsException
 
 @pytest.fixture(scope="session", autouse=True)
 def before_tests():
@@ -24,13 +22,6 @@ def before_tests():
                 functions[func['name']] = get_function_bytecode(func)
         return functions
     
-    def analyse_bytecode(folder_path, target_folder_path):
-        class_files = glob.glob(folder_path + '/**/*.class', recursive=True)
-        for class_file in class_files:
-            json_file = pathlib.Path(class_file).name.replace('.class', '.json')
-            command = ["jvm2json", "-s", class_file, "-t", target_folder_path + json_file]
-            subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    
     global byte_codes
     folder_path_class_files = "src/executables/java/dtu/compute/exec"
     folder_path = "decompiled/dtu/compute/exec/"
@@ -42,8 +33,8 @@ def before_tests():
         with open(file_path, 'r') as file:
             byte_codes.update(get_functions(json.load(file)))
 
-def run_interpreter(byte_code, memory=None, stack=None, locals=None):
-    interpret = Interpreter(byte_code, False, byte_codes)
+def run_interpreter(byte_code, memory=None, stack=None, locals=None, mode=Interpreter.INTERPRET):
+    interpret = Interpreter(byte_code, False, byte_codes, mode=mode)
     interpret.memory = memory or []
     return interpret.run((locals or [], stack or [], 0))
 
@@ -88,3 +79,140 @@ def test_access():
 
 def test_newArray():
     assert run_interpreter(byte_codes['newArray']) == 1
+
+def test_first_out_of_bounds():
+    with pytest.raises(ArrayIndexOutOfBoundsException):
+        run_interpreter(byte_codes['first'], memory=[[]], locals=[0])
+
+
+@pytest.mark.parametrize("byte_code_name, locals", [
+    ("zero", []),
+    ("identity", [7]),
+    ("min", [3, -4]),
+    ("factorial", [12]),
+    ("newArray", []),
+])
+def test_compiled_mode(byte_code_name, locals):
+    expected = run_interpreter(byte_codes[byte_code_name], locals=list(locals))
+    assert run_interpreter(byte_codes[byte_code_name], locals=list(locals), mode=Interpreter.COMPILED) == expected
+
+def test_compiled_extra_locals():
+    # a void method without locals, called with one argument more than it uses
+    noop = {"max_stack": 0, "max_locals": 0, "bytecode": [{"opr": "return", "type": None}]}
+    assert run_interpreter(noop, locals=[1], mode=Interpreter.COMPILED) is None
+
+def test_compiled_deep_recursion():
+    from benchmark import recursion
+    programs = {"depth": recursion()}
+    interpret = Interpreter(programs['depth'], False, programs, mode=Interpreter.COMPILED)
+    assert interpret.run(([5000], [], 0)) == 5000
+
+def test_memoized_pure_method():
+    memo = MemoCache(maxsize=8)
+    for _ in range(3):
+        interpret = Interpreter(byte_codes['factorial'], False, byte_codes, memo=memo)
+        assert interpret.run(([10], [], 0)) == math.factorial(10)
+    assert (memo.hits, memo.misses) == (2, 1)
+
+    interpret = Interpreter(byte_codes['helloWorld'], False, byte_codes, memo=memo)
+    interpret.run(([], [], 0))
+    assert (memo.hits, memo.misses) == (2, 1)
+
+def test_memo_shared_between_program_sets():
+    # the same name and arguments in two program sets must not share a memoized result
+    memo = MemoCache()
+    constant = lambda value: {"max_stack": 1, "max_locals": 0, "bytecode": [
+        {"opr": "push", "value": {"type": "integer", "value": value}}, {"opr": "return", "type": "int"}]}
+    for value in (1, 2):
+        programs = {"constant": constant(value)}
+        interpret = Interpreter(programs['constant'], False, programs, memo=memo)
+        assert interpret.run(([], [], 0)) == value
+    assert memo.hits == 0
+
+def test_push_null():
+    programs = dict(byte_codes)
+    programs['nothing'] = {"max_stack": 1, "max_locals": 0, "bytecode": [
+        {"opr": "push", "value": None}, {"opr": "return", "type": "ref"}]}
+    for mode in (Interpreter.INTERPRET, Interpreter.COMPILED):
+        interpret = Interpreter(programs['nothing'], False, programs, mode=mode, memo=MemoCache())
+        assert interpret.run(([], [], 0)) is None
+    interpret = Interpreter(programs['factorial'], False, programs, memo=MemoCache())
+    assert interpret.run(([5], [], 0)) == 120
+
+def test_profiler():
+    profile = Profiler()
+    interpret = Interpreter(byte_codes['factorial'], False, byte_codes, profile=profile)
+    assert interpret.run(([6], [], 0)) == math.factorial(6)
+    report = profile.to_json()
+    steps = sum(opcode["count"] for opcode in report["opcodes"].values())
+    assert steps == sum(report["pcs"]["factorial"].values())
+    assert profile.collapsed().startswith("factorial ")
+
+def test_load_functions():
+    for path in glob.glob("decompiled/dtu/compute/exec/**/*.json", recursive=True):
+        functions = load_functions(path)
+        with open(path, 'r') as file:
+            expected = get_functions(json.load(file))
+        assert list(functions) == list(expected)
+        assert all(functions[name] == expected[name] for name in expected)
+
+def test_program_image(tmp_path):
+    from image import ProgramImage, compile_image
+    compile_image("decompiled/dtu/compute/exec/", str(tmp_path / "cases.img"))
+    image = ProgramImage(str(tmp_path / "cases.img"))
+    assert sorted(image) == sorted(byte_codes)
+    assert all(image[name] == byte_codes[name] for name in byte_codes)
+    interpret = Interpreter(image['factorial'], False, image)
+    assert interpret.run(([10], [], 0)) == math.factorial(10)
+
+    from runner import load_image_cases, load_cases
+    (image, signatures) = load_image_cases(str(tmp_path / "cases.img"))
+    assert signatures.loaded == {}
+    assert dict(signatures) == load_cases("decompiled/dtu/compute/exec/")[1]
+
+def test_heap_values():
+    values = [1, 2, 3]
+    heap = Heap([values])
+    heap.store(0, 1, 2**40)
+    assert values == [1, 2**40, 3]
+    ref = heap.allocate("int", [2])
+    heap.store(ref, 0, 2**40)
+    assert list(heap[ref]) == [2**40, 0]
+    ref = heap.allocate({"kind": "class", "name": "java/lang/String"}, [2])
+    assert list(heap[ref]) == [None, None]
+
+def test_load_functions_braces_in_strings(tmp_path):
+    for path in glob.glob("decompiled/dtu/compute/exec/**/*.json", recursive=True):
+        with open(path, 'r') as file:
+            json_obj = json.load(file)
+        json_obj['methods'][0]['name'] += "}"
+        with open(tmp_path / "braces.json", 'w') as file:
+            json.dump(json_obj, file, indent=2)
+        functions = load_functions(str(tmp_path / "braces.json"))
+        expected = get_functions(json_obj)
+        assert sorted(functions) == sorted(expected)
+        assert all(functions[name] == expected[name] for name in expected)
+
+def test_step_limit():
+    interpret = Interpreter(byte_codes['factorial'], False, byte_codes, limits=Limits(steps=3))
+    assert interpret.run(([10], [], 0)) is None
+    assert interpret.outcome.status == Outcome.FUEL_EXHAUSTED
+    assert interpret.run(([3], [], 0)) is None
+    interpret.limits = None
+    assert interpret.run(([3], [], 0)) == 6
+
+    interpret = Interpreter(byte_codes['factorial'], False, byte_codes, limits=Limits(steps=1000))
+    assert interpret.run(([10], [], 0)) == math.factorial(10)
+    assert interpret.outcome.status == Outcome.RETURNED
+
+@pytest.mark.parametrize("byte_code_name, arg_num", [
+    ("sub", 2),
+    ("min", 2),
+    ("factorial", 1),
+])
+def test_batch_matches_interpreter(byte_code_name, arg_num):
+    pytest.importorskip("numpy")
+    from batch import run_batch
+    inputs = [[random.randint(-50, 50) for _ in range(arg_num)] for _ in range(200)]
+    expected = [run_interpreter(byte_codes[byte_code_name], locals=list(args)) for args in inputs]
+    assert run_batch(byte_codes[byte_code_name], inputs, byte_codes) == expected
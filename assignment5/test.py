@@ -0,0 +1,102 @@
+import pytest
+import json
+import glob
+from interpreter import analyse_bytecode, get_functions, load_functions, AbstractInterpreter, AnalysisCache, ControlFlowGraph, SignDomain, IntervalDomain
+
+@pytest.fixture(scope="session", autouse=True)
+def before_tests():
+    global byte_codes
+    folder_path_class_files = "src/executables/java/dtu/compute/exec"
+    folder_path = "decompiled/dtu/compute/exec/"
+    analyse_bytecode(folder_path_class_files, folder_path)
+
+    byte_codes = {}
+    for file_path in glob.glob(folder_path + '/**/*.json', recursive=True):
+        with open(file_path, 'r') as file:
+            byte_codes.update(get_functions(json.load(file)))
+
+def divide_by_zero():
+    # x / 0
+    return {"max_stack": 2, "max_locals": 1, "bytecode": [
+        {"opr": "load", "type": "int", "index": 0},
+        {"opr": "push", "value": {"type": "integer", "value": 0}},
+        {"opr": "binary", "type": "int", "operant": "div"},
+        {"opr": "return", "type": "int"}]}
+
+@pytest.mark.parametrize("domain", [SignDomain(), IntervalDomain()])
+def test_must_divide_by_zero(domain):
+    analysis = AbstractInterpreter(domain)
+    assert analysis.abstract_interpretation(divide_by_zero(), [7]) == {(2, "divide by zero"): "must"}
+    assert not analysis.terminates
+
+def negate_then_divide_by_zero():
+    # -x / 0, where negate is not modelled by the analysis
+    program = divide_by_zero()
+    program["bytecode"].insert(1, {"opr": "negate", "type": "int"})
+    return program
+
+@pytest.mark.parametrize("domain", [SignDomain(), IntervalDomain()])
+def test_unsupported_instruction_is_reported(domain):
+    analysis = AbstractInterpreter(domain)
+    errors = analysis.abstract_interpretation(negate_then_divide_by_zero(), [7])
+    assert errors == {(1, "unsupported negate"): "may", (3, "divide by zero"): "must"}
+
+def test_unsupported_callee_may_return():
+    # caller(x) = opaque(x) / 0, where opaque ends in an instruction without a fixed stack effect
+    opaque = {"max_stack": 1, "max_locals": 1, "bytecode": [
+        {"opr": "load", "type": "int", "index": 0},
+        {"opr": "tableswitch", "default": 2, "low": 0, "high": 0, "targets": [2]},
+        {"opr": "return", "type": "int"}]}
+    caller = divide_by_zero()
+    caller["bytecode"].insert(1, {"opr": "invoke", "access": "static", "method": {
+        "is_interface": False, "ref": {"kind": "class", "name": "Test"}, "name": "opaque", "args": ["int"], "returns": "int"}})
+    analysis = AbstractInterpreter(IntervalDomain(), {"opaque": opaque, "caller": caller})
+    assert analysis.abstract_interpretation(caller, [7]) == {
+        (1, "unsupported tableswitch in opaque"): "may", (3, "divide by zero"): "must"}
+
+def test_must_out_of_bounds():
+    analysis = AbstractInterpreter(IntervalDomain(), byte_codes)
+    errors = analysis.abstract_interpretation(byte_codes['access'], [3, [1, 2, 3]])
+    assert set(errors.values()) == {"must"}
+    assert {kind for (_, kind) in errors} == {"out of bounds"}
+
+def test_access_in_range():
+    analysis = AbstractInterpreter(IntervalDomain(), byte_codes)
+    assert analysis.abstract_interpretation(byte_codes['access'], [1, [1, 2, 3]]) == {}
+    assert analysis.terminates
+
+def test_factorial_visits_bounded():
+    bytecode = byte_codes['factorial']['bytecode']
+    assert ControlFlowGraph.of(bytecode).heads
+    analysis = AbstractInterpreter(IntervalDomain(), byte_codes)
+    analysis.abstract_interpretation(byte_codes['factorial'], [10])
+    assert analysis.visits <= 4 * len(bytecode)
+    assert analysis.returns[0] >= 1
+
+def test_parallel_matches_serial():
+    serial = AbstractInterpreter(IntervalDomain(), byte_codes)
+    serial.analyse_program(workers=1)
+    parallel = AbstractInterpreter(IntervalDomain(), byte_codes)
+    parallel.analyse_program(workers=2)
+    assert serial.summaries == parallel.summaries
+    assert serial.reports == parallel.reports
+
+def test_warm_cache(tmp_path):
+    cold = AbstractInterpreter(IntervalDomain(), byte_codes, cache=AnalysisCache(tmp_path))
+    cold.analyse_program(workers=1)
+    cache = AnalysisCache(tmp_path)
+    warm = AbstractInterpreter(IntervalDomain(), byte_codes, cache=cache)
+    warm.analyse_program(workers=1)
+    assert cache.misses == 0 and cache.hits > 0
+    assert warm.reports == cold.reports
+
+def test_cached_method_table_is_lazy(tmp_path):
+    functions = load_functions("decompiled/dtu/compute/exec/Simple.json")
+    table = AnalysisCache(tmp_path).method_table(functions)
+    assert functions.loaded == {}
+    code = table['factorial'].code
+    assert list(functions.loaded) == ['factorial']
+    cache = AnalysisCache(tmp_path)
+    table = cache.method_table(load_functions("decompiled/dtu/compute/exec/Simple.json"))
+    assert table['factorial'].code == code
+    assert (cache.hits, cache.misses) == (1, 0)
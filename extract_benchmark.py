@@ -0,0 +1,132 @@
+import sys
+import json
+import time
+import glob
+import argparse
+
+from main import extract_class_details, extract_fields, extract_methods
+
+
+def extract_class_details_recursive(json_obj):
+    # The previous extractor, kept as the reference the iterative one is checked against
+    dependencies, interfaces, fields, methods, compositions = set(), set(), set(), set(), set()
+
+    if isinstance(json_obj, dict):
+        for key, value in json_obj.items():
+            if key in ["type", "ref"] and value:
+                if "name" in value and "/" in value["name"] and not value["name"] == "java/lang/Object":
+                    dependencies.add(value["name"])
+
+            if key == "interfaces":
+                interfaces.update({interface["name"] for interface in value})
+
+            if key == "fields":
+                fields.update(extract_fields(value))
+
+            if key == "methods":
+                methods.update(extract_methods(value))
+
+            if key == "innerclasses" and value and isinstance(value, list) and len(value) > 0 and json_obj["name"] == value[0]["class"]:
+                compositions.add(value[0]["outer"])
+
+            sub_dependencies, sub_interfaces, sub_fields, sub_methods, sub_compositions = extract_class_details_recursive(value)
+            dependencies.update(sub_dependencies)
+            interfaces.update(sub_interfaces)
+            fields.update(sub_fields)
+            methods.update(sub_methods)
+            compositions.update(sub_compositions)
+
+    elif isinstance(json_obj, list):
+        for item in json_obj:
+            sub_dependencies, sub_interfaces, sub_fields, sub_methods, sub_compositions = extract_class_details_recursive(item)
+            dependencies.update(sub_dependencies)
+            interfaces.update(sub_interfaces)
+            fields.update(sub_fields)
+            methods.update(sub_methods)
+            compositions.update(sub_compositions)
+
+    return dependencies, interfaces, fields, methods, compositions
+
+
+def class_ref(k):
+    return {"kind": "class", "name": f"org/example/pkg{k % 7}/Type{k % 50}"}
+
+
+def synthetic_class(method_count, instructions):
+    # Shaped like jvm2json output: fields, methods with bytecode full of type and method refs, inner classes
+    methods = []
+    for m in range(method_count):
+        bytecode = []
+        for pc in range(instructions):
+            if pc % 3 == 0:
+                bytecode.append({"offset": pc, "opr": "invoke", "access": "virtual",
+                                 "method": {"is_interface": False, "ref": class_ref(pc + m), "name": f"call{pc}",
+                                            "args": [{"type": class_ref(pc)}, {"base": "int"}], "returns": {"type": class_ref(m)}}})
+            elif pc % 3 == 1:
+                bytecode.append({"offset": pc, "opr": "get", "static": False,
+                                 "field": {"class": f"org/example/Owner{m}", "name": f"f{pc}", "type": class_ref(pc * 3)}})
+            else:
+                bytecode.append({"offset": pc, "opr": "load", "type": "int", "index": pc % 4})
+        methods.append({"name": f"method{m}", "access": ["public"] if m % 2 else ["private"],
+                        "params": [{"visible": True, "type": class_ref(m)}], "returns": {"type": class_ref(m + 1)},
+                        "code": {"max_stack": 4, "max_locals": 4, "bytecode": bytecode}, "annotations": []})
+    return {"name": "org/example/Big", "access": ["public"], "super": {"name": "java/lang/Object"},
+            "interfaces": [{"name": "org/example/Service"}, {"name": "java/lang/Runnable"}],
+            "fields": [{"name": f"field{k}", "access": ["private"], "type": class_ref(k)} for k in range(200)],
+            "methods": methods,
+            "innerclasses": [{"class": "org/example/Big", "outer": "org/example/Outer", "name": "Big"}]}
+
+
+def deep_class(depth):
+    node = {"kind": "class", "name": "org/example/Leaf"}
+    for _ in range(depth):
+        node = {"kind": "array", "type": node}
+    return {"name": "org/example/Deep", "fields": [{"name": "deep", "access": ["public"], "type": node}], "methods": []}
+
+
+def best_time(function, json_obj, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(json_obj)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def compare(name, json_obj, repeat):
+    iterative_time, iterative = best_time(extract_class_details, json_obj, repeat)
+    try:
+        recursive_time, recursive = best_time(extract_class_details_recursive, json_obj, repeat)
+    except RecursionError:
+        print(f"{name:40s} recursive: RecursionError  iterative {iterative_time * 1000:9.2f} ms")
+        return True
+    identical = recursive == iterative
+    print(f"{name:40s} recursive {recursive_time * 1000:9.2f} ms  iterative {iterative_time * 1000:9.2f} ms  "
+          f"speedup {recursive_time / iterative_time:5.2f}x  {'identical' if identical else 'DIFFERENT'}")
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the iterative class extractor with the recursive one")
+    parser.add_argument("folders", nargs="*", help="folders of jvm2json output to compare on")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    identical = True
+    identical &= compare("synthetic 200 methods x 300 instructions", synthetic_class(200, 300), args.repeat)
+    identical &= compare("synthetic 2000 methods x 100 instructions", synthetic_class(2000, 100), args.repeat)
+    identical &= compare(f"nesting depth {sys.getrecursionlimit() * 2}", deep_class(sys.getrecursionlimit() * 2), 1)
+    for folder in args.folders:
+        paths = glob.glob(folder + '/**/*.json', recursive=True)
+        classes = []
+        for path in paths:
+            with open(path, 'r') as file:
+                classes.append(json.load(file))
+        identical &= compare(f"{folder} ({len(paths)} classes)", classes, args.repeat)
+
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,47 +3,45 @@ import glob
 import subprocess
 import pydot
 import os
+import math
+import hashlib
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
 def get_all_files_with_extension(folder_path, extension):
     pattern = f"{folder_path}/**/*.{extension}"
     return glob.glob(pattern, recursive=True)
 
 def extract_class_details(json_obj):
+    # One walk over the class with an explicit stack; every node adds to the same five sets
     dependencies, interfaces, fields, methods, compositions = set(), set(), set(), set(), set()
 
-    if isinstance(json_obj, dict):
-        for key, value in json_obj.items():
-            if key in ["type", "ref"] and value:
-                if "name" in value and "/" in value["name"] and not value["name"] == "java/lang/Object":
+    stack = [json_obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key in ("type", "ref"):
+                value = node.get(key)
+                if value and "name" in value and "/" in value["name"] and not value["name"] == "java/lang/Object":
                     dependencies.add(value["name"])
 
-            if key == "interfaces":
-                interfaces.update({interface["name"] for interface in value})
+            if "interfaces" in node:
+                interfaces.update(interface["name"] for interface in node["interfaces"])
 
-            if key == "fields":
-                fields.update(extract_fields(value))
+            if "fields" in node:
+                fields.update(extract_fields(node["fields"]))
 
-            if key == "methods":
-                methods.update(extract_methods(value))
+            if "methods" in node:
+                methods.update(extract_methods(node["methods"]))
 
-            if key == "innerclasses" and value and isinstance(value, list) and len(value) > 0 and json_obj["name"] == value[0]["class"]:
+            value = node.get("innerclasses")
+            if value and isinstance(value, list) and len(value) > 0 and node["name"] == value[0]["class"]:
                 compositions.add(value[0]["outer"])
 
-            sub_dependencies, sub_interfaces, sub_fields, sub_methods, sub_compositions = extract_class_details(value)
-            dependencies.update(sub_dependencies)
-            interfaces.update(sub_interfaces)
-            fields.update(sub_fields)
-            methods.update(sub_methods)
-            compositions.update(sub_compositions)
-            
-    elif isinstance(json_obj, list):
-        for item in json_obj:
-            sub_dependencies, sub_interfaces, sub_fields, sub_methods, sub_compositions = extract_class_details(item)
-            dependencies.update(sub_dependencies)
-            interfaces.update(sub_interfaces)
-            fields.update(sub_fields)
-            methods.update(sub_methods)
-            compositions.update(sub_compositions)
+            stack.extend(value for value in node.values() if isinstance(value, (dict, list)))
+
+        elif isinstance(node, list):
+            stack.extend(item for item in node if isinstance(item, (dict, list)))
 
     return dependencies, interfaces, fields, methods, compositions
 
@@ -72,30 +70,215 @@ def extract_methods(methods_data):
             pass
     return methods
 
-def convert_class_files_to_json(folder_path):
-    for class_file in get_all_files_with_extension(folder_path, "class"):
-        json_file = class_file.replace('.class', '.json')
-        command = ["jvm2json", "-s", class_file, "-t", json_file]
-        subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+def convert_class_file(class_file):
+    # Returns None on success, else the error. The .json is only replaced when jvm2json succeeds, so a
+    # failed conversion leaves the previous one in place
+    json_file = class_file.replace('.class', '.json')
+    temporary = f"{json_file}.{os.getpid()}.tmp"
+    command = ["jvm2json", "-s", class_file, "-t", temporary]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as error:
+        return str(error)
+    if result.returncode != 0:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return f"exit code {result.returncode}: {result.stderr.decode(errors='replace').strip()}"
+    os.replace(temporary, json_file)
+    return None
+
+def file_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def class_details(json_obj, class_name):
+    dependencies, interfaces, fields, methods, compositions = extract_class_details(json_obj)
+
+    dependencies = dependencies.difference(compositions).difference({class_name}).difference({name for name in dependencies if '$' in name})
+    interfaces = {name for name in interfaces if '$' not in name}
+    fields = {name for name in fields if '$' not in name}
+    methods = {name for name in methods if '$' not in name}
+
+    return {
+        'name': json_obj.get('name', class_name),
+        'dependencies': dependencies,
+        'interfaces': interfaces,
+        'fields': fields,
+        'methods': methods,
+        'compositions': compositions
+    }
+
+CACHE_VERSION = 1
+
+def read_details_cache(cache_path):
+    try:
+        with open(cache_path, 'r') as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return cache.get("classes", {}) if cache.get("version") == CACHE_VERSION else {}
+
+def write_details_cache(cache_path, entries):
+    temporary = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as file:
+        json.dump({"version": CACHE_VERSION, "classes": entries}, file)
+    os.replace(temporary, cache_path)
+
+def extract_source(source, digest):
+    # Returns (entry, error). When jvm2json fails but an older .json exists, the entry is extracted from it
+    # and returned together with the error
+    error = None
+    path = source
+    if source.endswith(".class"):
+        path = source.replace('.class', '.json')
+        error = convert_class_file(source)
+        if error is not None:
+            error = f"jvm2json failed for {source}: {error}"
+            if not os.path.exists(path):
+                return None, error
+    try:
+        with open(path, 'r') as file:
+            json_obj = json.load(file)
+    except (OSError, ValueError) as read_error:
+        return None, error or f"could not read {path}: {read_error}"
+    class_name = os.path.basename(path).replace(".json", "")
+    details = class_details(json_obj, class_name)
+    return {"hash": digest, "class_name": class_name,
+            "details": {key: value if isinstance(value, str) else sorted(value) for key, value in details.items()}}, error
+
+def extract_chunk(chunk):
+    return [(source, *extract_source(source, digest)) for source, digest in chunk]
+
+def load_classes(folder_path, cache_path=None, workers=None, chunksize=64):
+    # Details are cached per source file under the hash of its content, so only changed .class files go
+    # through jvm2json and extraction again. JSON files without a .class file are keyed by their own hash.
+    if cache_path is None:
+        cache_path = os.path.join(folder_path, ".class-details-cache.json")
+    cache = read_details_cache(cache_path)
+    class_files = get_all_files_with_extension(folder_path, "class")
+    converted = {class_file.replace('.class', '.json') for class_file in class_files}
+    sources = sorted(class_files + [path for path in get_all_files_with_extension(folder_path, "json") if path not in converted])
+
+    entries, stale = {}, []
+    for source in sources:
+        digest = file_hash(source)
+        entry = cache.get(source)
+        if entry is None or entry["hash"] != digest:
+            stale.append((source, digest))
+        else:
+            entries[source] = entry
+
+    # Changed classes are extracted in chunks across a process pool; records come back in submission order
+    chunks = [stale[k:k + chunksize] for k in range(0, len(stale), chunksize)]
+    if workers == 1 or len(chunks) <= 1:
+        records = [extract_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            records = list(pool.map(extract_chunk, chunks))
+    # A class that failed is reported and, if an older .json could still be read, used for this run only;
+    # it is not cached, so it goes through jvm2json again next time
+    fallbacks = {}
+    for chunk in records:
+        for source, entry, error in chunk:
+            if error is not None:
+                print(error, file=sys.stderr)
+                if entry is not None:
+                    fallbacks[source] = entry
+            elif entry is not None:
+                entries[source] = entry
+    entries = dict(sorted(entries.items()))
+    write_details_cache(cache_path, entries)
+
+    # Keyed by JVM name, so classes with the same simple name in different packages are all kept
+    classes = {}
+    for entry in dict(sorted({**entries, **fallbacks}.items())).values():
+        classes[entry["details"].get("name", entry["class_name"])] = {key: value if isinstance(value, str) else set(value) for key, value in entry["details"].items()}
+    return classes
+
+def escape_html(text):
+    return text.replace('<', '&lt;').replace('>', '&gt;')
+
+def class_label(class_name, class_details):
+    # Name, then fields and methods each under a separator; empty sections are left out
+    sections = [lines for lines in (class_details.get('fields'), class_details.get('methods')) if lines]
+    parts = ["<", class_name, "<br align='left'/>"]
+    for lines in sections:
+        parts.append("--------<br/>")
+        parts.extend(escape_html(line) + "<br align='left'/>" for line in lines)
+    parts.append(">")
+    return "".join(parts)
+
+def render_diagram(diagram, output, formats, engine):
+    # Graphviz lays the graph out once; neato -n2 then renders every format from those fixed positions
+    positioned = diagram.create(prog=engine, format="dot")
+    for output_format in formats:
+        path = f"{output}.{output_format}"
+        if output_format == "dot":
+            with open(path, "wb") as file:
+                file.write(positioned)
+            continue
+        subprocess.run(["neato", "-n2", f"-T{output_format}", "-o", path], input=positioned, check=True)
+
+def package_of(name):
+    return name.rsplit("/", 1)[0] if "/" in name else ""
+
+def generate_large_class_diagram(classes, collapse_packages=False, formats=("png", "svg"), engine="sfdp", output="class_diagram"):
+    # Classes are grouped into one cluster per package and the edges between two nodes are merged into one
+    # weighted edge. With collapse_packages every package becomes a single node. Nodes are named by JVM name
+    # and labelled by simple name. Edges to classes outside the codebase are left out, since a few library
+    # types would otherwise pull every node together.
+    uml_diagram = pydot.Dot(graph_type='digraph', engine=engine, dpi=300, overlap="prism", outputorder="edgesfirst")
+    classes = {class_details.get('name', class_name): class_details for class_name, class_details in classes.items()}
+    packages = {}
+    for name in classes:
+        packages.setdefault(package_of(name), []).append(name)
+
+    node_of = {}
+    for index, (package, names) in enumerate(sorted(packages.items())):
+        if collapse_packages:
+            label = f"{package or '(default)'}\n{len(names)} classes"
+            uml_diagram.add_node(pydot.Node(f"package_{index}", shape="folder", label=label))
+            node_of.update((name, f"package_{index}") for name in names)
+            continue
+        cluster = pydot.Cluster(f"package_{index}", label=package or "(default)")
+        for name in names:
+            label = class_label(name.rsplit("/", 1)[-1], classes[name])
+            cluster.add_node(pydot.Node(name, shape="rectangle", label=label))
+            node_of[name] = name
+        uml_diagram.add_subgraph(cluster)
+
+    # Parallel edges keep the strongest arrowhead: realisation over composition over dependency
+    arrowheads = ("vee", "diamond", "onormal")
+    edges = {}
+    for name, class_details in classes.items():
+        for key, arrowhead in zip(('dependencies', 'compositions', 'interfaces'), arrowheads):
+            for target in class_details.get(key, ()):
+                if target not in classes or node_of[target] == node_of[name]:
+                    continue
+                edge = (node_of[name], node_of[target])
+                (count, strongest) = edges.get(edge, (0, 0))
+                edges[edge] = (count + 1, max(strongest, arrowheads.index(arrowhead)))
 
-def generate_class_diagram(classes, two_rows=False):
-    uml_diagram = pydot.Dot(graph_type='digraph', engine='neato', dpi=300)
+    for (source, target), (count, strongest) in sorted(edges.items()):
+        penwidth = 1 + math.log2(count)
+        uml_diagram.add_edge(pydot.Edge(source, target, arrowhead=arrowheads[strongest], weight=count, penwidth=f"{penwidth:.2f}"))
+
+    render_diagram(uml_diagram, output, formats, engine)
+
+def generate_class_diagram(classes, two_rows=False, formats=("png", "svg"), engine=None, output="class_diagram",
+                           large_threshold=300, collapse_packages=False):
+    # engine defaults to dot, Graphviz's own default, or to sfdp once the large-graph mode takes over
+    if len(classes) > large_threshold or collapse_packages:
+        return generate_large_class_diagram(classes, collapse_packages, formats, engine or "sfdp", output)
+
+    # The small layout names nodes by simple class name, as it always has
+    classes = dict(sorted(((name.rsplit("/", 1)[-1], details) for name, details in classes.items()), key=lambda item: item[0]))
+    engine = engine or "dot"
+    uml_diagram = pydot.Dot(graph_type='digraph', engine=engine, dpi=300)
     pydot_classes = {}
 
     for class_name, class_details in classes.items():
-        label = "<" + class_name + "<br align='left'/>--------<br/>"
-        if 'fields' in class_details:
-            for field in class_details['fields']:
-                label += field.replace('<', '&lt;').replace('>', '&gt;') + "<br align='left'/>"
-        if label[-5:] != "<br/>":
-            label += "--------<br/>"
-        if 'methods' in class_details:
-            for method in class_details['methods']:
-                label += method.replace('<', '&lt;').replace('>', '&gt;') + "<br align='left'/>"
-        if label[-5:] == "<br/>":
-            label = label[:-13]
-        label += ">"
-
+        label = class_label(class_name, class_details)
         class_node = pydot.Node(class_name, shape="rectangle", label=label)
 
         if class_node:
@@ -127,38 +310,17 @@ def generate_class_diagram(classes, two_rows=False):
             invisible_edge = pydot.Edge(pydot_classes[class_names[i]], pydot_classes[class_names[i+1]], weight=1, style="invis")
             uml_diagram.add_edge(invisible_edge)
 
-    uml_diagram.write_png("class_diagram.png")
-    uml_diagram.write_svg("class_diagram.svg")
+    render_diagram(uml_diagram, output, formats, engine)
 
 
-def main(folder_path):
-    convert_class_files_to_json(folder_path)
-
-    classes = {}
-    for path in get_all_files_with_extension(folder_path, "json"):
-        with open(path, 'r') as file:
-            json_obj = json.load(file)
-            class_name = os.path.basename(path).replace(".json", "")
-            class_name = class_name.split("/")[-1]  # Take only the last part of the path
-            dependencies, interfaces, fields, methods, compositions = extract_class_details(json_obj)
-
-            dependencies = dependencies.difference(compositions).difference({class_name}).difference({name for name in dependencies if '$' in name})
-            interfaces = {name for name in interfaces if '$' not in name}
-            fields = {name for name in fields if '$' not in name}
-            methods = {name for name in methods if '$' not in name}
-
-            classes[class_name] = {
-                'dependencies': dependencies,
-                'interfaces': interfaces,
-                'fields': fields,
-                'methods': methods,
-                'compositions': compositions
-            }
+def main(folder_path, formats=("png", "svg"), engine=None, large_threshold=300, collapse_packages=False, workers=None):
+    classes = load_classes(folder_path, workers=workers)
 
     # Sort class names
     sorted_classes = dict(sorted(classes.items()))
 
-    generate_class_diagram(sorted_classes, two_rows=True)
+    generate_class_diagram(sorted_classes, two_rows=True, formats=formats, engine=engine,
+                           large_threshold=large_threshold, collapse_packages=collapse_packages)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+import pytest
+import main
+
+class Diagram:
+    def __init__(self):
+        self.progs = []
+
+    def create(self, prog, format):
+        self.progs.append((prog, format))
+        return b"digraph { a [pos=\"0,0\"]; }"
+
+@pytest.fixture
+def commands(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main.subprocess, "run", lambda command, **kwargs: calls.append((command, kwargs)))
+    return calls
+
+def test_render_diagram(tmp_path, commands):
+    diagram = Diagram()
+    output = str(tmp_path / "diagram")
+    main.render_diagram(diagram, output, ("dot", "png", "svg"), "dot")
+    assert diagram.progs == [("dot", "dot")]
+    assert (tmp_path / "diagram.dot").read_bytes() == b"digraph { a [pos=\"0,0\"]; }"
+    assert [command for (command, _) in commands] == [
+        ["neato", "-n2", "-Tpng", "-o", output + ".png"],
+        ["neato", "-n2", "-Tsvg", "-o", output + ".svg"]]
+    assert all(kwargs == {"input": b"digraph { a [pos=\"0,0\"]; }", "check": True} for (_, kwargs) in commands)
+
+@pytest.mark.parametrize("count, engine", [(2, "dot"), (3, "sfdp")])
+def test_default_engine(monkeypatch, tmp_path, commands, count, engine):
+    progs = []
+    monkeypatch.setattr(main.pydot.Dot, "create", lambda self, prog, format: progs.append(prog) or b"digraph {}")
+    classes = {f"dtu/compute/C{k}": {"name": f"dtu/compute/C{k}", "fields": set(), "methods": set()} for k in range(count)}
+    main.generate_class_diagram(classes, formats=("png",), output=str(tmp_path / "diagram"), large_threshold=2)
+    assert progs == [engine]
+
+def test_failed_conversion_falls_back_uncached(monkeypatch, tmp_path, capsys):
+    (tmp_path / "A.class").write_bytes(b"\xca\xfe\xba\xbe")
+    (tmp_path / "A.json").write_text('{"name": "pkg/A", "fields": [], "methods": []}')
+    (tmp_path / "B.class").write_bytes(b"\xca\xfe\xba\xbe")
+    failed = main.subprocess.CompletedProcess([], 1, b"", b"bad class file")
+    monkeypatch.setattr(main.subprocess, "run", lambda command, **kwargs: failed)
+    classes = main.load_classes(str(tmp_path), workers=1)
+    assert list(classes) == ["pkg/A"]
+    errors = capsys.readouterr().err
+    assert f"jvm2json failed for {tmp_path / 'A.class'}: exit code 1: bad class file" in errors
+    assert f"jvm2json failed for {tmp_path / 'B.class'}" in errors
+    assert main.read_details_cache(str(tmp_path / ".class-details-cache.json")) == {}
+    assert (tmp_path / "A.json").exists() and not (tmp_path / "B.json").exists()